@@ -1,17 +1,12 @@
 import streamlit as st
-import io
-import os
-import torch
+import sys
+import time
 import logging
-from ultralytics import YOLO
-from google.cloud import storage
-from PIL import Image
-import numpy as np
-import cv2
-import tempfile
-from datetime import datetime
-import sqlite3
-import uuid
+from scanner import scan_new_images
+from metrics import fetch_snapshot
+from storage_backend import open_bucket
+from engine import (BUCKET_NAME, DEFAULT_INPUT_FOLDER_GCS, DEFAULT_OUTPUT_IMAGES_GCS, DEFAULT_OUTPUT_LABELS_GCS,
+                    METRICS_URL, open_store)
 
 st.set_page_config(
     page_title="Fish Detector",
@@ -19,225 +14,88 @@ st.set_page_config(
     layout="wide"
 )
 
-# Configure logging to use StreamHandler
-log_stream = io.StringIO()
-logging.basicConfig(stream=log_stream, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Log to stdout, so messages show up in the container logs next to the job runner's
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Initialize Google Cloud Storage client
-client = storage.Client()
-bucket_name = "nmfs_odp_pifsc"
+# Bucket and one long-lived WAL job store per server process (shared by every session).
+# Inference and the database backup to GCS run in the separate job runner (python -m engine), which
+# loads the model once; this app only creates and submits jobs and reads their progress, so closing
+# the browser stops nothing.
+@st.cache_resource
+def get_services():
+    return open_bucket(BUCKET_NAME), open_store()
 
-# Default input and output GCS directories
-DEFAULT_INPUT_FOLDER_GCS = "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/raw/"
-DEFAULT_OUTPUT_IMAGES_GCS = "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/images/"
-DEFAULT_OUTPUT_LABELS_GCS = "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/labels/"
+bucket, store = get_services()
 
-# SQLite database file
-DB_FILE = "processed_images.db"
-BACKUP_INTERVAL = 1000  # Sync the database every 1,000 images processed
+# Scan and create a job of the images not yet in the database (resumes an interrupted scan)
+def scan_and_create_job(input_folder_gcs):
+    scan_progress = st.empty()
+    job_id, total_unprocessed = scan_new_images(
+        store, bucket, input_folder_gcs,
+        on_page=lambda pages, names: scan_progress.text(f"Scanned {names} images ({pages} pages)..."))
 
-# Check if CUDA is available and load the large model (YOLOv8x) to CUDA if possible
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-st.write(f"Using device: {device}")
-
-# Load the YOLO model from the downloaded location
-large_model = YOLO("/app/yolov8n_fish_trained.pt")
-large_model = large_model.to(device)
-
-# Define GCS bucket
-bucket = client.bucket(bucket_name)
-
-# Initialize SQLite database connection
-def initialize_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    # Update the table schema to store additional details
-    cursor.execute('''CREATE TABLE IF NOT EXISTS images (
-                        image_name TEXT PRIMARY KEY,
-                        processed BOOLEAN,
-                        detections BOOLEAN,
-                        confidence REAL,
-                        processed_timestamp TEXT,
-                        job_id TEXT,
-                        batch_id INTEGER)''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS jobs (
-                        job_id TEXT PRIMARY KEY,
-                        total_images INTEGER,
-                        completed_batches INTEGER)''')
-    conn.commit()
-    return conn
-
-# Load processed images from SQLite
-def load_processed_images_db():
-    conn = initialize_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT image_name, detections FROM images WHERE processed = 1")
-    processed_images = {row[0]: row[1] for row in cursor.fetchall()}
-    conn.close()
-    return processed_images
-
-# Restore cumulative counters from the database
-def restore_cumulative_counters():
-    conn = initialize_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*), SUM(detections) FROM images WHERE processed = 1")
-    processed_count, detections_count = cursor.fetchone()
-    conn.close()
-    return processed_count or 0, detections_count or 0
-
-# Scan and create 10 dynamic batches
-def scan_and_create_batches(input_folder_gcs):
-    blobs = client.list_blobs(bucket_name, prefix=input_folder_gcs)
-    image_list = [blob.name for blob in blobs if blob.name.endswith(('.jpg', '.png'))]
-    
-    conn = initialize_db()
-    cursor = conn.cursor()
-
-    # Retrieve unprocessed images
-    cursor.execute("SELECT image_name FROM images WHERE processed = 0")
-    existing_unprocessed = set(row[0] for row in cursor.fetchall())
-    unprocessed_images = [img for img in image_list if img not in existing_unprocessed]
-
-    total_unprocessed = len(unprocessed_images)
     if total_unprocessed == 0:
         st.warning("No unprocessed images found.")
         return
 
-    # Split into 10 even batches
-    batch_size = max(1, total_unprocessed // 10)
-    batches = [unprocessed_images[i:i + batch_size] for i in range(0, total_unprocessed, batch_size)]
-    
-    # Create a new job ID
-    job_id = str(uuid.uuid4())
-    
-    # Save each image to the database with its batch_id
-    for batch_id, batch in enumerate(batches):
-        for image_name in batch:
-            cursor.execute("INSERT OR IGNORE INTO images (image_name, processed, job_id, batch_id) VALUES (?, 0, ?, ?)",
-                           (image_name, job_id, batch_id))
-    
-    conn.commit()
-    conn.close()
-
-    st.success(f"Job created with ID {job_id}, Total Unprocessed Images: {total_unprocessed}, Batches: {len(batches)}")
-
-# Update SQLite with processed image and details
-def update_processed_images_db(image_name, detections, confidence):
-    conn = initialize_db()
-    cursor = conn.cursor()
-    processed_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute("INSERT OR REPLACE INTO images (image_name, processed, detections, confidence, processed_timestamp) VALUES (?, 1, ?, ?, ?)",
-                   (image_name, detections, confidence, processed_timestamp))
-    conn.commit()
-    conn.close()
-
-# Backup SQLite database to GCS in multiple locations
-def backup_db_to_gcs():
-    try:
-        db_blob1 = bucket.blob("PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/logs/processed_images.db")
-        db_blob1.upload_from_filename(DB_FILE)
-        logging.info("SQLite database backed up to GCS (logs folder).")
-        
-        db_blob2 = bucket.blob("PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/database/processed_images.db")
-        db_blob2.upload_from_filename(DB_FILE)
-        logging.info("SQLite database backed up to GCS (database folder).")
-        
-    except Exception as e:
-        logging.error(f"Failed to backup SQLite database to GCS: {e}")
-
-# Function to read images directly from GCS and save to a temporary file
-def read_image_from_gcs_and_save(image_blob):
-    try:
-        img_bytes = image_blob.download_as_bytes()
-        img = Image.open(io.BytesIO(img_bytes))
-        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_file:
-            img.save(temp_file.name)
-            temp_file_path = temp_file.name
-        return temp_file_path
-    except Exception as e:
-        logging.error(f"Failed to read image {image_blob.name}: {e}")
-        return None
-
-# Function to process images, run inference, and save results
-def process_batch(job_id, batch_id, output_images_gcs, output_labels_gcs, confidence):
-    conn = initialize_db()
-    cursor = conn.cursor()
-
-    # Get the list of images for the batch
-    cursor.execute("SELECT image_name FROM images WHERE job_id = ? AND batch_id = ? AND processed = 0", (job_id, batch_id))
-    image_names = [row[0] for row in cursor.fetchall()]
-    
-    if not image_names:
-        st.warning("No images to process for this batch.")
+    # The runner owns the backup; flag the new job so it snapshots the whole scan at once
+    store.request_backup(job_id)
+    st.success(f"Job created with ID {job_id}, Total Unprocessed Images: {total_unprocessed}")
+
+# Live job progress, re-run every 2 seconds on its own without rerunning the whole page
+@st.fragment(run_every=2)
+def show_progress(job_id):
+    progress = store.job_progress(job_id)
+    status = store.job_status(job_id) or "not submitted"
+
+    # Throughput from the change in processed images since the previous poll of this session
+    now = time.monotonic()
+    previous = st.session_state.get('last_poll')
+    st.session_state['last_poll'] = (job_id, now, progress['processed'])
+    rate = 0.0
+    if previous and previous[0] == job_id and now > previous[1]:
+        rate = (progress['processed'] - previous[2]) / (now - previous[1])
+
+    total = progress['total'] or 1
+    st.progress(min(progress['processed'] / total, 1.0), text=f"Job {job_id}: {status}")
+    columns = st.columns(4)
+    columns[0].metric("Processed Images", f"{progress['processed']} / {progress['total']}")
+    columns[1].metric("Images with Detections", progress['detections'])
+    columns[2].metric("Throughput (images/s)", f"{rate:.1f}")
+    columns[3].metric("Active Runners", progress['workers'])
+    if status in ('queued', 'running') and not progress['workers']:
+        st.caption("Waiting for a job runner (python -m engine) to pick up this job.")
+    show_runner_metrics()
+
+# Live dashboard from the job runner's metrics endpoint (the same data as its /metrics and JSON log line)
+def show_runner_metrics():
+    snapshot = fetch_snapshot(METRICS_URL)
+    if not snapshot:
+        st.caption(f"Runner metrics unavailable ({METRICS_URL}).")
         return
-
-    # Load cumulative counters
-    cumulative_processed, cumulative_detections = restore_cumulative_counters()
-    session_processed = 0
-    session_detections = 0
-    sync_count = 0
-
-    # Streamlit UI to display counters
-    processed_images_placeholder = st.empty()
-    images_with_detections_placeholder = st.empty()
-
-    for image_name in image_names:
-        blob = bucket.blob(image_name)
-        temp_image_path = read_image_from_gcs_and_save(blob)
-        if temp_image_path is None:
-            continue
-        
-        try:
-            image = cv2.imread(temp_image_path)
-            if image is None or image.shape[0] == 0 or image.shape[1] == 0:
-                continue
-            
-            results = large_model.predict(temp_image_path, conf=confidence)
-            has_detections = results[0].boxes is not None and len(results[0].boxes) > 0
-            detected_confidence = max([box.conf[0] for box in results[0].boxes]) if has_detections else 0.0
-            
-            # Track session stats
-            session_processed += 1
-            sync_count += 1
-            if has_detections:
-                session_detections += 1
-
-            # Update the database for each image processed
-            update_processed_images_db(image_name, has_detections, detected_confidence)
-
-            # Save results to GCS if there are detections
-            if has_detections:
-                output_image_gcs_path = f"{output_images_gcs}{os.path.basename(image_name)}"
-                upload_to_gcs(temp_image_path, output_image_gcs_path)
-
-                label_path = temp_image_path.replace(".jpg", ".txt")
-                image_height, image_width, _ = image.shape
-                save_yolo_format_labels(results, label_path, image_width, image_height)
-                output_label_gcs_path = f"{output_labels_gcs}{os.path.basename(image_name).replace('.jpg', '.txt')}"
-                upload_to_gcs(label_path, output_label_gcs_path)
-
-            # Sync database every 1,000 images
-            if sync_count >= BACKUP_INTERVAL:
-                conn.commit()
-                backup_db_to_gcs()
-                sync_count = 0
-
-            # Update Streamlit UI counters
-            processed_images_placeholder.metric("Processed Images (Total / Session)", f"{cumulative_processed + session_processed} / {session_processed}")
-            images_with_detections_placeholder.metric("Images with Detections (Total / Session)", f"{cumulative_detections + session_detections} / {session_detections}")
-
-        except Exception as e:
-            logging.error(f"Failed to process {image_name}: {e}")
-
-        finally:
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
-    
-    # Final sync and backup
-    conn.commit()
-    backup_db_to_gcs()
-    conn.close()
-    st.success("Batch processing complete.")
+    st.subheader("Runner Performance")
+    gpu = snapshot['gpu'] or {}
+    columns = st.columns(4)
+    columns[0].metric("Runner Throughput (images/s)", f"{snapshot['images_per_s']:.1f}")
+    columns[1].metric("Runner CPU", f"{snapshot['cpu_percent']:.0f}%")
+    columns[2].metric("GPU Utilization", "n/a" if gpu.get('utilization') is None else f"{gpu['utilization']}%")
+    columns[3].metric("GPU Memory (MB)", f"{gpu['memory_mb']:.0f}" if gpu else "n/a")
+
+    # Stage latencies over recent calls; the slowest stage per image is the likely bottleneck
+    rows = []
+    for stage, summary in snapshot['stages'].items():
+        if summary['count']:
+            rows.append({'stage': stage, 'calls': summary['count'], 'images': summary['items'],
+                         'p50 ms': summary['p50'] * 1000, 'p95 ms': summary['p95'] * 1000, 'p99 ms': summary['p99'] * 1000,
+                         'busy s / image': summary['seconds'] / max(summary['items'], 1)})
+    if rows:
+        st.dataframe(rows, hide_index=True)
+
+    # A queue that stays full means the stage after it is the bottleneck; an empty one, the stage before it
+    depths = {f"after {name}": q['depth'] for name, q in snapshot['queues'].items()}
+    depths.update({name: value for name, value in snapshot['gauges'].items() if value is not None})
+    if depths:
+        st.bar_chart({'queue': list(depths), 'depth': list(depths.values())}, x='queue', y='depth')
     
 # Streamlit UI Elements
 st.title("🐟 Google Cloud Fish Detector - NODD App 3.0")
@@ -261,21 +119,26 @@ For more information:
 confidence = st.sidebar.slider("Detection Confidence Threshold", 0.0, 1.0, 0.65)
 
 # Job Management UI
-if st.sidebar.button("Scan & Divide Unprocessed Into 10 Batches"):
-    scan_and_create_batches(DEFAULT_INPUT_FOLDER_GCS)
+if st.sidebar.button("Scan for Unprocessed Images"):
+    scan_and_create_job(DEFAULT_INPUT_FOLDER_GCS)
 
-# Load existing job IDs from the database
-conn = initialize_db()
-cursor = conn.cursor()
-cursor.execute("SELECT DISTINCT job_id FROM images")
-job_ids = [row[0] for row in cursor.fetchall()]
-conn.close()
+# Existing jobs from the (small) jobs table, newest first
+jobs = {job['job_id']: job for job in store.jobs()}
 
-if job_ids:
-    job_id = st.sidebar.selectbox("Select Job ID", job_ids)
-    batch_id = st.sidebar.number_input("Batch ID (0-9)", min_value=0, max_value=9)
+if jobs:
+    job_id = st.sidebar.selectbox("Select Job ID", list(jobs),
+                                  format_func=lambda job_id: f"{job_id} ({jobs[job_id]['status'] or 'new'}, {jobs[job_id]['total_images']} images)")
 
-    if st.sidebar.button("Start Processing Selected Batch"):
-        process_batch(job_id, batch_id, DEFAULT_OUTPUT_IMAGES_GCS, DEFAULT_OUTPUT_LABELS_GCS, confidence)
+    if st.sidebar.button("Submit Job for Processing"):
+        try:
+            store.submit_job(job_id, confidence, DEFAULT_OUTPUT_IMAGES_GCS, DEFAULT_OUTPUT_LABELS_GCS)
+            st.sidebar.success(f"Job {job_id} queued at confidence {confidence}.")
+        except ValueError as e:
+            st.sidebar.error(str(e))
+    if jobs[job_id]['status'] in ('queued', 'running') and st.sidebar.button("Cancel Job"):
+        store.set_job_status(job_id, 'cancelled')
+        st.sidebar.info("The runner stops after its current chunk.")
+
+    show_progress(job_id)
 else:
     st.sidebar.warning("No jobs available. Scan for unprocessed images to create a new job.")
@@ -0,0 +1,175 @@
+# backup.py
+# Incremental backups of the job database: small append-only change-log segments between
+# occasional full snapshots, all uploaded from a background thread.
+#
+#   <changes_prefix>segment-<ns>.jsonl.gz   images/jobs rows changed since the previous segment
+#   <changes_prefix>manifest.json           {"snapshot_after": last segment folded into the snapshot}
+#   snapshot_names[0], snapshot_names[1]... full database made with the SQLite online backup API
+#
+# Restore = download the snapshot, then replay the segments newer than snapshot_after.
+
+import os
+import sys
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+
+from job_store import JobStore, MARK_PROCESSED, CHANGE_KEYS
+
+class DatabaseBackup:
+    """
+    Back up a JobStore to a bucket without blocking processing.
+
+    Triggers in the database record every images/jobs row changed by any process (the runner,
+    workers, the UI). Every segment_seconds, or on request(), the background thread writes the
+    current content of those rows as one gzip JSONL segment and clears them. Every compact_every
+    segments (or on request(full=True) and close()) the thread also takes a consistent snapshot of
+    the live database with the SQLite backup API, uploads it to the first snapshot name, server-side copies
+    it to the others, and deletes the segments it now contains. Snapshots identical to the last
+    uploaded one are skipped, and requests arriving while a backup runs are merged into one.
+    """
+    def __init__(self, store, bucket, snapshot_names, changes_prefix, compact_every=20, segment_seconds=60):
+        self.store = store
+        self.bucket = bucket
+        self.snapshot_names = list(snapshot_names)
+        self.changes_prefix = changes_prefix
+        self.compact_every = compact_every
+        self.segment_seconds = segment_seconds
+        self._lock = threading.Lock()
+        self._segments = 0
+        self._full = False
+        self._last_hash = None
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name='db-backup', daemon=True)
+        self._thread.start()
+
+    def request(self, full=False):
+        """
+        Schedule a backup (a change segment, or a full snapshot if full=True) and return immediately.
+        """
+        with self._lock:
+            self._full = self._full or full
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop:
+            self._wake.wait(self.segment_seconds)
+            self._wake.clear()
+            try:
+                self.backup_now()
+            except Exception as e:
+                logging.error(f"Failed to backup SQLite database to GCS: {e}")
+
+    def backup_now(self):
+        """
+        Write the pending change segment, and a snapshot if one is due. Runs in the calling thread.
+        """
+        self.store.flush()
+        last_seq, rows = self.store.changed_rows()
+        with self._lock:
+            full, self._full = self._full or (bool(rows) and self._segments + 1 >= self.compact_every), False
+        if rows:
+            self._write_segment(rows)
+        if last_seq is not None:
+            self.store.clear_changes(last_seq)
+        if full:
+            self._snapshot()
+
+    def _write_segment(self, rows):
+        name = f"{self.changes_prefix}segment-{time.time_ns():020d}.jsonl.gz"
+        lines = "".join(json.dumps({'table': table, 'row': row}) + "\n" for table, row in rows)
+        self.bucket.blob(name).upload_from_string(gzip.compress(lines.encode()), content_type='application/gzip')
+        self._segments += 1
+        logging.info(f"Backed up {len(rows)} changed rows to {name}.")
+
+    def _snapshot(self):
+        # Every segment written so far is already in the database the snapshot is taken from
+        segments = [blob.name for blob in self.bucket.list_blobs(prefix=self.changes_prefix + 'segment-')]
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        try:
+            # A separate read connection sees a consistent WAL snapshot while processing keeps writing
+            source = sqlite3.connect(self.store.path)
+            target = sqlite3.connect(path)
+            with target:
+                source.backup(target)
+            source.close()
+            target.close()
+            with open(path, 'rb') as file:
+                digest = hashlib.sha256(file.read()).hexdigest()
+            if digest != self._last_hash:
+                first = self.bucket.blob(self.snapshot_names[0])
+                first.upload_from_filename(path)
+                for name in self.snapshot_names[1:]:
+                    self.bucket.copy_blob(first, self.bucket, name)
+                self._last_hash = digest
+                logging.info(f"SQLite database snapshot uploaded to {', '.join(self.snapshot_names)}.")
+        finally:
+            os.remove(path)
+
+        # Compaction: the snapshot now holds those segments, so restores can skip and we can delete them
+        if segments:
+            manifest = {'snapshot_after': max(segments)}
+            self.bucket.blob(self.changes_prefix + 'manifest.json').upload_from_string(json.dumps(manifest), content_type='application/json')
+            for name in segments:
+                self.bucket.blob(name).delete()
+        self._segments = 0
+
+    def close(self):
+        """
+        Stop the background thread after a final snapshot.
+        """
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+        with self._lock:
+            self._full = True
+        self.backup_now()
+
+def restore(bucket, snapshot_name, changes_prefix, path):
+    """
+    Rebuild the database at path from the snapshot plus newer change segments. Returns replayed rows.
+    """
+    snapshot = bucket.blob(snapshot_name)
+    if snapshot.exists():
+        with open(path, 'wb') as file:
+            file.write(snapshot.download_as_bytes())
+    manifest_blob = bucket.blob(changes_prefix + 'manifest.json')
+    after = json.loads(manifest_blob.download_as_bytes()).get('snapshot_after', '') if manifest_blob.exists() else ''
+    segments = sorted(blob.name for blob in bucket.list_blobs(prefix=changes_prefix + 'segment-') if blob.name > after)
+
+    store = JobStore(path)
+    replayed = 0
+    for name in segments:
+        rows = [json.loads(line) for line in gzip.decompress(bucket.blob(name).download_as_bytes()).decode().splitlines()]
+        with store.conn:
+            for row in rows:
+                if 'table' in row:
+                    if row['table'] not in CHANGE_KEYS:
+                        continue
+                    columns = list(row['row'])
+                    store.conn.execute(f"INSERT OR REPLACE INTO {row['table']} ({', '.join(columns)}) "
+                                       f"VALUES ({', '.join('?' * len(columns))})", [row['row'][column] for column in columns])
+                else:
+                    # Segments written before the changes table only held image results
+                    store.conn.execute(MARK_PROCESSED, (row['image_name'], row['detections'], row['confidence'],
+                                                        row['processed_timestamp']))
+        replayed += len(rows)
+    # The replayed rows are already backed up
+    with store.conn:
+        store.conn.execute("DELETE FROM changes")
+    store.close()
+    print(f"Restored {path} from {snapshot_name} + {len(segments)} change segments ({replayed} rows)")
+    return replayed
+
+if __name__ == '__main__':
+    # python backup.py <bucket> <snapshot blob> <changes prefix> <database path>
+    from storage_backend import open_bucket
+    bucket_name, snapshot_name, changes_prefix, path = sys.argv[1:5]
+    restore(open_bucket(bucket_name), snapshot_name, changes_prefix, path)
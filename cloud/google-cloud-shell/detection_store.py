@@ -0,0 +1,183 @@
+# detection_store.py
+# Every detected box (not just a per-image yes/no) kept in compressed Parquet segments, so
+# positives and labels can be re-derived at any confidence threshold without rerunning inference.
+#
+#   <prefix>segment-<ns>-<id>.parquet   columns: image_name, class_id, confidence,
+#                                        x_center, y_center, width, height, model_version
+
+import io
+import os
+import time
+import uuid
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from postprocess import DETECTION_COLUMNS, stack_detections
+
+SCHEMA = pa.schema([
+    ('image_name', pa.string()),
+    ('class_id', pa.int32()),
+    ('confidence', pa.float32()),
+    ('x_center', pa.float32()),
+    ('y_center', pa.float32()),
+    ('width', pa.float32()),
+    ('height', pa.float32()),
+    ('model_version', pa.string()),
+])
+
+def _segment_name(prefix):
+    return f"{prefix}segment-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+
+def _to_parquet_bytes(table):
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression='zstd', use_dictionary=['image_name', 'model_version'])
+    return buffer.getvalue()
+
+class DetectionWriter:
+    """
+    Collect per-image detections arrays (see postprocess.detections_array) and upload them as Parquet
+    segments of up to rows_per_segment boxes through an Uploader. Call close() to write the rest.
+    """
+    def __init__(self, uploader, prefix, model_version, rows_per_segment=200000):
+        self.uploader = uploader
+        self.prefix = prefix
+        self.model_version = model_version
+        self.rows_per_segment = rows_per_segment
+        self._lock = threading.Lock()
+        self._names = []
+        self._arrays = []
+        self._rows = 0
+        self.segments = 0
+
+    def add(self, image_name, detections):
+        if not len(detections):
+            return
+        with self._lock:
+            self._names.append(image_name)
+            self._arrays.append(detections)
+            self._rows += len(detections)
+            if self._rows < self.rows_per_segment:
+                return
+            names, arrays = self._take()
+        self._write(names, arrays)
+
+    def _take(self):
+        names, arrays = self._names, self._arrays
+        self._names, self._arrays, self._rows = [], [], 0
+        return names, arrays
+
+    def _write(self, names, arrays):
+        columns = stack_detections(names, arrays)
+        columns['model_version'] = [self.model_version] * len(columns['image_name'])
+        table = pa.table({field.name: columns[field.name] for field in SCHEMA}, schema=SCHEMA)
+        self.uploader.submit(_segment_name(self.prefix), _to_parquet_bytes(table), 'application/vnd.apache.parquet')
+        self.segments += 1
+
+    def close(self):
+        with self._lock:
+            names, arrays = self._take()
+        if names:
+            self._write(names, arrays)
+
+def sync_segments(bucket, prefix, cache_dir):
+    """
+    Download segments under prefix that are not in cache_dir yet and delete cached ones that no
+    longer exist (after compact()). Returns the number of downloaded segments.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    remote = {blob.name.rsplit('/', 1)[-1]: blob.name for blob in bucket.list_blobs(prefix=prefix + 'segment-')}
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith('.parquet') and file_name not in remote:
+            os.remove(os.path.join(cache_dir, file_name))
+    downloaded = 0
+    for file_name, name in remote.items():
+        path = os.path.join(cache_dir, file_name)
+        if not os.path.exists(path):
+            with open(path + '.tmp', 'wb') as file:
+                file.write(bucket.blob(name).download_as_bytes())
+            os.replace(path + '.tmp', path)
+            downloaded += 1
+    return downloaded
+
+def query_detections(cache_dir, min_confidence=None, class_ids=None, model_version=None, columns=None):
+    """
+    Read the cached segments as one pyarrow Table, with filters pushed down to the Parquet reader
+    (row groups that cannot match are skipped). Use .to_pandas() or .column(...) on the result.
+    """
+    filters = []
+    if min_confidence is not None:
+        filters.append(('confidence', '>=', float(min_confidence)))
+    if class_ids is not None:
+        filters.append(('class_id', 'in', [int(class_id) for class_id in class_ids]))
+    if model_version is not None:
+        filters.append(('model_version', '=', model_version))
+    files = sorted(os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.parquet'))
+    if not files:
+        return SCHEMA.empty_table()
+    return pq.ParquetDataset(files, filters=filters or None, schema=SCHEMA).read(columns=columns)
+
+def detections_by_image(table):
+    """
+    {image_name: (n, 6) detections array} from a query_detections table, in the postprocess column order.
+    """
+    if table.num_rows == 0:
+        return {}
+    table = table.sort_by('image_name')
+    names = table.column('image_name').to_numpy()
+    values = np.column_stack([table.column(name).to_numpy().astype(np.float32) for name in DETECTION_COLUMNS])
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+    return {names[start]: values[start:end] for start, end in zip(starts, np.r_[starts[1:], len(names)])}
+
+def compact(bucket, prefix, min_rows=200000):
+    """
+    Merge segments smaller than min_rows into larger ones (many small segments are written when
+    workers process small chunks). Returns (segments merged, segments written).
+    """
+    small = []
+    for blob in bucket.list_blobs(prefix=prefix + 'segment-'):
+        table = pq.read_table(io.BytesIO(bucket.blob(blob.name).download_as_bytes()))
+        if table.num_rows < min_rows:
+            small.append((blob.name, table))
+    if len(small) < 2:
+        return 0, 0
+    written, batch, rows = 0, [], 0
+    for name, table in small + [(None, None)]:
+        if table is not None:
+            batch.append((name, table))
+            rows += table.num_rows
+        if batch and (rows >= min_rows or table is None):
+            merged = pa.concat_tables([table for _, table in batch])
+            bucket.blob(_segment_name(prefix)).upload_from_string(_to_parquet_bytes(merged), content_type='application/vnd.apache.parquet')
+            for old_name, _ in batch:
+                bucket.blob(old_name).delete()
+            written += 1
+            batch, rows = [], 0
+    return len(small), written
+
+if __name__ == '__main__':
+    # python detection_store.py query --min-confidence 0.5    (positives at a threshold, no GPU)
+    # python detection_store.py compact
+    import argparse
+    from storage_backend import open_bucket
+    from engine import BUCKET_NAME, DETECTIONS_GCS
+
+    parser = argparse.ArgumentParser(description="Query or compact the Parquet detection store.")
+    parser.add_argument('command', choices=['query', 'compact'])
+    parser.add_argument('--min-confidence', type=float, default=None)
+    parser.add_argument('--cache-dir', default='detections_cache', help="Local copy of the segments")
+    args = parser.parse_args()
+
+    bucket = open_bucket(BUCKET_NAME)
+    if args.command == 'compact':
+        merged, written = compact(bucket, DETECTIONS_GCS)
+        print(f"Merged {merged} small segments into {written}")
+    else:
+        start = time.perf_counter()
+        downloaded = sync_segments(bucket, DETECTIONS_GCS, args.cache_dir)
+        table = query_detections(args.cache_dir, args.min_confidence, columns=['image_name', 'confidence'])
+        images = len(set(table.column('image_name').to_pylist()))
+        print(f"{table.num_rows} boxes on {images} images at confidence >= {args.min_confidence} "
+              f"({downloaded} new segments, {time.perf_counter() - start:.1f}s)")
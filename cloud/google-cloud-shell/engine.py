@@ -0,0 +1,252 @@
+# engine.py
+# Processing core of the fish detector, importable without Streamlit: settings, model loading and
+# the download -> decode -> inference -> upload loop for a list of images.
+#
+# Run as the long-lived job runner (start.sh starts it next to the Streamlit UI, which only submits
+# jobs and shows their progress from the database):
+#
+#   python -m engine
+
+import os
+import sys
+import signal
+import logging
+import argparse
+import mimetypes
+import threading
+
+import numpy as np
+import cv2
+
+from pipeline import run_pipeline
+from prefetch import Prefetcher
+from storage_backend import open_bucket
+from uploader import Uploader, LabelBundler, PositiveImages
+from job_store import JobStore
+from backup import DatabaseBackup
+from postprocess import detections_array, above_threshold, max_confidence, format_yolo_labels, label_name
+from detection_store import DetectionWriter
+from worker import run_worker
+from metrics import METRICS, start_exporters
+
+# Google Cloud Storage bucket name (set STORAGE_ROOT to use a local folder instead, see storage_backend.py)
+BUCKET_NAME = "nmfs_odp_pifsc"
+MODEL_PATH = os.environ.get("MODEL_PATH", "/app/yolov8n_fish_trained.pt")
+
+# Default input and output GCS directories
+DEFAULT_INPUT_FOLDER_GCS = "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/raw/"
+DEFAULT_OUTPUT_IMAGES_GCS = "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/images/"
+DEFAULT_OUTPUT_LABELS_GCS = "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/labels/"
+
+# Every detected box as Parquet segments (see detection_store.py), tagged with the model version
+DETECTIONS_GCS = "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/detections/"
+MODEL_VERSION = os.environ.get("MODEL_VERSION", os.path.basename(MODEL_PATH))
+# Inference keeps every box down to this confidence in the detections store; positives and labels use
+# the chosen threshold and can be re-exported at any threshold >= the floor without the GPU (export.py)
+INFERENCE_FLOOR = float(os.environ.get("INFERENCE_FLOOR", 0.05))
+
+# SQLite database file
+DB_FILE = os.environ.get("DB_FILE", "processed_images.db")
+BACKUP_INTERVAL = 1000  # Sync the database every 1,000 images processed...
+DB_SEGMENT_SECONDS = 60  # ...and every minute, which also picks up rows written by workers and the UI
+DB_FLUSH_ROWS = 500  # Write buffered image results every 500 rows...
+DB_FLUSH_SECONDS = 2.0  # ...or every 2 seconds, whichever comes first
+DB_SNAPSHOT_GCS = [
+    "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/logs/processed_images.db",
+    "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/database/processed_images.db",
+]
+DB_CHANGES_GCS = "PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/database/changes/"
+
+# Inference pipeline settings: images per forward pass, worker threads and bounded queue depth
+PREDICT_BATCH_SIZE = int(os.environ.get("PREDICT_BATCH_SIZE", 16))
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 16))  # Downloads kept in flight by the prefetcher
+PREFETCH_MAX_MB = int(os.environ.get("PREFETCH_MAX_MB", 256))  # Byte budget for downloads in flight
+DECODE_WORKERS = int(os.environ.get("DECODE_WORKERS", 4))
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 8))  # Background upload threads for positives
+POSITIVE_MODE = os.environ.get("POSITIVE_MODE", "copy")  # "copy" (server-side), "manifest" (references only) or "upload"
+LABEL_BUNDLE = os.environ.get("LABEL_BUNDLE", "")  # "" = one .txt per image, or bundle labels as "jsonl" / "tar"
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 64))
+
+# Live metrics (see metrics.py): Prometheus/JSON endpoint of the job runner (0 = off) and JSON log line interval
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9100))
+METRICS_LOG_SECONDS = float(os.environ.get("METRICS_LOG_SECONDS", 30))
+METRICS_URL = os.environ.get("METRICS_URL", f"http://localhost:{METRICS_PORT}/metrics.json")
+
+def load_model(path=MODEL_PATH):
+    """
+    Load the YOLO model onto the GPU if one is available. Returns (model, device).
+    """
+    import torch
+    from ultralytics import YOLO
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = YOLO(path).to(device)
+    return model, device
+
+def open_store(db_file=DB_FILE):
+    return JobStore(db_file, flush_rows=DB_FLUSH_ROWS, flush_seconds=DB_FLUSH_SECONDS)
+
+def open_services(db_file=DB_FILE):
+    """
+    Open the bucket, the job store and its background backup. Returns (bucket, store, backup).
+    Only the job runner backs up the database, including rows written by the UI and workers, which
+    open just the bucket and the store (open_store); the UI asks for full snapshots with
+    store.request_backup.
+    """
+    bucket = open_bucket(BUCKET_NAME, pool_size=DOWNLOAD_WORKERS + UPLOAD_WORKERS)
+    store = open_store(db_file)
+    backup = DatabaseBackup(store, bucket, DB_SNAPSHOT_GCS, DB_CHANGES_GCS, segment_seconds=DB_SEGMENT_SECONDS)
+    return bucket, store, backup
+
+# Function to decode downloaded bytes straight into a BGR array for inference (no temp files)
+def decode_image(image_name, img_bytes):
+    image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None or image.shape[0] == 0 or image.shape[1] == 0:
+        logging.error(f"Failed to read image {image_name}")
+        return None
+    return image
+
+def process_images(image_names, model, bucket, store, backup, output_images_gcs, output_labels_gcs, confidence,
+                   on_progress=None, stop_event=None):
+    """
+    Run detection over image_names at INFERENCE_FLOOR, record every result in the store and the
+    detections store, and write positives at `confidence` (image + YOLO label) to the output prefixes. on_progress(progress) is called about once a second from
+    the calling thread with the pipeline counters plus 'detections', 'downloads' and 'uploads'
+    stats. Stage timings and queue depths go to METRICS. backup is None in processes that do not
+    own the database backup (worker.py). Returns the final progress dict.
+    """
+    prefetcher = Prefetcher(bucket, image_names, max_in_flight=DOWNLOAD_WORKERS, max_bytes=PREFETCH_MAX_MB << 20,
+                            observe=METRICS.observe)
+    uploader = Uploader(bucket, workers=UPLOAD_WORKERS, observe=METRICS.observe)
+    bundler = LabelBundler(uploader, output_labels_gcs, LABEL_BUNDLE) if LABEL_BUNDLE else None
+    positives = PositiveImages(uploader, POSITIVE_MODE, manifest_prefix=output_images_gcs)
+    detection_writer = DetectionWriter(uploader, DETECTIONS_GCS, MODEL_VERSION)
+    session = {'detections': 0, 'sync_count': 0}
+    queues = {}
+    METRICS.track_queues(queues)
+    METRICS.gauge('downloads_in_flight', lambda: prefetcher.in_flight)
+    METRICS.gauge('uploads_pending', lambda: uploader.pending)
+
+    def predict(images):
+        # One forward pass for the whole batch of decoded arrays; boxes leave the GPU once per image
+        return [detections_array(result) for result in model.predict(images, conf=min(confidence, INFERENCE_FLOOR), verbose=False)]
+
+    def handle_result(image_name, img_bytes, image, detections):
+        # Keep every box down to the floor, then only export those at the chosen threshold
+        detection_writer.add(image_name, detections)
+        positive = above_threshold(detections, confidence)
+        has_detections = len(positive) > 0
+
+        # Record the result for each image processed (buffered, written in bulk); the confidence column
+        # keeps its meaning (best box at the threshold), floor-level scores live in the detections store
+        store.mark_processed(image_name, has_detections, max_confidence(positive))
+
+        # Save results to GCS if there are detections (uploads run in the background)
+        if has_detections:
+            session['detections'] += 1
+            METRICS.count('detections')
+            output_image_gcs_path = f"{output_images_gcs}{os.path.basename(image_name)}"
+            positives.add(image_name, output_image_gcs_path, img_bytes, mimetypes.guess_type(image_name)[0] or 'image/jpeg')
+
+            labels = format_yolo_labels(positive)
+            if bundler:
+                bundler.add(label_name(image_name), labels)
+            else:
+                uploader.submit(f"{output_labels_gcs}{label_name(image_name)}", labels, 'text/plain')
+
+        # Back up the changes every 1,000 images (runs in the background)
+        session['sync_count'] += 1
+        if session['sync_count'] >= BACKUP_INTERVAL:
+            if backup:
+                backup.request()
+            session['sync_count'] = 0
+
+    def progress(stats):
+        return dict(stats, detections=session['detections'], downloads=prefetcher.stats(), uploads=uploader.stats())
+
+    def report(stats):
+        store.flush_if_due()
+        if on_progress:
+            on_progress(progress(stats))
+
+    try:
+        stats = run_pipeline(prefetcher, None, decode_image, predict, handle_result,
+                             batch_size=PREDICT_BATCH_SIZE, decode_workers=DECODE_WORKERS,
+                             queue_size=PIPELINE_QUEUE_SIZE, on_progress=report, stop_event=stop_event,
+                             queues=queues, observe=METRICS.observe)
+    finally:
+        # Drain: write the last detections segment, manifest and label bundle, then wait for every queued upload
+        detection_writer.close()
+        positives.close()
+        if bundler:
+            bundler.close()
+        uploader.close()
+    store.flush()
+    return progress(stats)
+
+def run_jobs(model, bucket, store, backup, stop_event, chunk_size=256, lease_seconds=300, poll_seconds=5):
+    """
+    Process submitted jobs (store.submit_job) oldest first, in leased chunks, until stop_event is
+    set. A job is checked for cancellation after every chunk and marked done once none of its images
+    are left to claim or leased by another runner. Full backups requested from the UI are taken
+    between chunks and while idle.
+    """
+    def take_requested_backup():
+        if store.take_backup_requests():
+            backup.request(full=True)
+
+    while not stop_event.is_set():
+        take_requested_backup()
+        job = store.next_job()
+        if not job:
+            stop_event.wait(poll_seconds)
+            continue
+        job_id = job['job_id']
+        store.set_job_status(job_id, 'running')
+        logging.info(f"Running job {job_id} at confidence {job['confidence']}")
+        job_stop = threading.Event()
+
+        def process_chunk(names, heartbeat):
+            process_images(names, model, bucket, store, backup, job['output_images'], job['output_labels'],
+                           job['confidence'], on_progress=heartbeat)
+            take_requested_backup()
+            if stop_event.is_set() or store.job_status(job_id) != 'running':
+                job_stop.set()
+
+        summary = run_worker(store, process_chunk, job_id, chunk_size, lease_seconds, stop_event=job_stop)
+        logging.info(f"Job {job_id}: {summary}")
+        backup.request()
+        if job_stop.is_set():
+            continue
+        if store.job_progress(job_id)['leased'] == 0:
+            store.set_job_status(job_id, 'done')
+            backup.request(full=True)
+            logging.info(f"Job {job_id} done")
+        else:
+            # Another runner still holds chunks of this job; look again once they may have finished
+            stop_event.wait(poll_seconds)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Long-lived runner for jobs submitted from the Fish Detector UI.")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Images claimed per lease")
+    parser.add_argument('--lease-seconds', type=int, default=300, help="Lease duration; renewed while the chunk runs")
+    parser.add_argument('--poll-seconds', type=float, default=5, help="How often to look for new jobs when idle")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Model and services are loaded once for the life of the process
+    model, device = load_model()
+    bucket, store, backup = open_services()
+    logging.info(f"Job runner started on {device}")
+    start_exporters(METRICS, METRICS_PORT, METRICS_LOG_SECONDS)
+
+    # SIGTERM/SIGINT finish the current chunk, then exit (the job stays queued for the next start)
+    stop_event = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop_event.set())
+
+    run_jobs(model, bucket, store, backup, stop_event, args.chunk_size, args.lease_seconds, args.poll_seconds)
+    backup.close()
+    store.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
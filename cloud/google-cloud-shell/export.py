@@ -0,0 +1,109 @@
+# export.py
+# Regenerate the positive images and YOLO labels for a new confidence threshold from the stored
+# detections (detection_store.py) instead of rerunning inference. Images are copied server-side and
+# labels written on a thread pool, so re-exporting a full survey takes minutes, not days.
+#
+#   python export.py --threshold 0.8 --prune
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from uploader import Uploader, LabelBundler, PositiveImages
+from postprocess import format_yolo_labels, label_name
+from detection_store import sync_segments, query_detections, detections_by_image
+
+EXPORT_MODES = ('copy', 'manifest')
+
+def export_at_threshold(bucket, detections_prefix, threshold, output_images_gcs, output_labels_gcs,
+                        cache_dir='detections_cache', model_version=None, class_ids=None,
+                        positive_mode='copy', label_bundle='', workers=32, prune=False):
+    """
+    Put every image with a stored box at or above threshold into output_images_gcs (server-side
+    copy, or rows of a manifest with positive_mode='manifest') and write those boxes as its YOLO
+    label under output_labels_gcs (one .txt per image, or bundled with label_bundle 'jsonl'/'tar').
+
+    Images already in the output folder are not copied again. With prune=True, objects under the
+    two output prefixes that this export did not produce (positives of a lower threshold, old
+    bundles and manifests) are deleted. Returns a summary dict.
+    """
+    if positive_mode not in EXPORT_MODES:
+        raise ValueError(f"Export can only copy or list positive images, not: {positive_mode}")
+    start = time.perf_counter()
+    downloaded = sync_segments(bucket, detections_prefix, cache_dir)
+    table = query_detections(cache_dir, threshold, class_ids, model_version)
+    positives = detections_by_image(table)
+    logging.info(f"{table.num_rows} boxes on {len(positives)} images at confidence >= {threshold} "
+                 f"({downloaded} new segments, {time.perf_counter() - start:.1f}s)")
+
+    existing = ({blob.name for blob in bucket.list_blobs(prefix=output_images_gcs)} |
+                {blob.name for blob in bucket.list_blobs(prefix=output_labels_gcs)})
+    produced = set()
+    skipped = boxes = 0
+    with Uploader(bucket, workers=workers) as uploader:
+        images = PositiveImages(uploader, positive_mode, manifest_prefix=output_images_gcs)
+        bundler = LabelBundler(uploader, output_labels_gcs, label_bundle) if label_bundle else None
+        for image_name, detections in positives.items():
+            # An image processed twice (a retried chunk) has its boxes stored twice; keep one of each
+            detections = np.unique(detections, axis=0)
+            boxes += len(detections)
+            output_image_gcs_path = f"{output_images_gcs}{os.path.basename(image_name)}"
+            produced.add(output_image_gcs_path)
+            if positive_mode == 'copy' and output_image_gcs_path in existing:
+                skipped += 1
+            else:
+                images.add(image_name, output_image_gcs_path, None)
+
+            labels = format_yolo_labels(detections)
+            if bundler:
+                bundler.add(label_name(image_name), labels)
+            else:
+                produced.add(f"{output_labels_gcs}{label_name(image_name)}")
+                uploader.submit(f"{output_labels_gcs}{label_name(image_name)}", labels, 'text/plain')
+        images.close()
+        if bundler:
+            bundler.close()
+
+        # New manifests and bundles were not listed above, so only older outputs can be pruned
+        stale = existing - produced if prune else set()
+        for name in stale:
+            uploader.submit_delete(name)
+
+    seconds = time.perf_counter() - start
+    return dict(uploader.stats(), threshold=threshold, images=len(positives), boxes=boxes,
+                already_present=skipped, pruned=len(stale), seconds=seconds)
+
+def main(argv=None):
+    from storage_backend import open_bucket
+    from engine import (BUCKET_NAME, DETECTIONS_GCS, DEFAULT_OUTPUT_IMAGES_GCS, DEFAULT_OUTPUT_LABELS_GCS,
+                        MODEL_VERSION, INFERENCE_FLOOR, POSITIVE_MODE, LABEL_BUNDLE)
+
+    parser = argparse.ArgumentParser(description="Re-export positive images and labels at a confidence threshold from stored detections.")
+    parser.add_argument('--threshold', type=float, required=True, help="Minimum box confidence")
+    parser.add_argument('--classes', type=int, nargs='+', default=None, help="Only export these class ids")
+    parser.add_argument('--model-version', default=MODEL_VERSION, help="Detections of this model version ('' for all)")
+    parser.add_argument('--output-images', default=DEFAULT_OUTPUT_IMAGES_GCS, help="Output prefix for positive images")
+    parser.add_argument('--output-labels', default=DEFAULT_OUTPUT_LABELS_GCS, help="Output prefix for labels")
+    parser.add_argument('--positive-mode', choices=EXPORT_MODES, default=POSITIVE_MODE if POSITIVE_MODE in EXPORT_MODES else 'copy')
+    parser.add_argument('--label-bundle', choices=['', 'jsonl', 'tar'], default=LABEL_BUNDLE)
+    parser.add_argument('--workers', type=int, default=32, help="Parallel copies/uploads")
+    parser.add_argument('--cache-dir', default='detections_cache', help="Local copy of the detection segments")
+    parser.add_argument('--prune', action='store_true', help="Delete outputs that are below the new threshold")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.threshold < INFERENCE_FLOOR:
+        logging.warning(f"Boxes below the inference floor ({INFERENCE_FLOOR}) were never stored; "
+                        f"a threshold of {args.threshold} exports the same as {INFERENCE_FLOOR}")
+    bucket = open_bucket(BUCKET_NAME, pool_size=args.workers)
+    summary = export_at_threshold(bucket, DETECTIONS_GCS, args.threshold, args.output_images, args.output_labels,
+                                  args.cache_dir, args.model_version or None, args.classes,
+                                  args.positive_mode, args.label_bundle, args.workers, args.prune)
+    logging.info(f"Export finished: {summary}")
+
+if __name__ == '__main__':
+    sys.exit(main())
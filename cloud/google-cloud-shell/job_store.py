@@ -0,0 +1,351 @@
+# job_store.py
+# Job and image state for the fish detector, kept in one long-lived SQLite connection in WAL mode.
+# Per-image results are buffered and written with executemany, so bookkeeping costs microseconds
+# per image instead of a connect/commit/close round trip.
+
+import time
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS images (
+        image_name TEXT PRIMARY KEY,
+        processed BOOLEAN,
+        detections BOOLEAN,
+        confidence REAL,
+        processed_timestamp TEXT,
+        job_id TEXT,
+        batch_id INTEGER)''',
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        total_images INTEGER,
+        completed_batches INTEGER)''',
+    "CREATE INDEX IF NOT EXISTS idx_images_job_batch ON images (job_id, batch_id, processed)",
+    "CREATE INDEX IF NOT EXISTS idx_images_processed ON images (processed)",
+    # Bucket scans in progress: names listed so far and the page token to resume from
+    '''CREATE TABLE IF NOT EXISTS scans (
+        job_id TEXT PRIMARY KEY,
+        prefix TEXT,
+        page_token TEXT,
+        pages INTEGER DEFAULT 0)''',
+    "CREATE TABLE IF NOT EXISTS scan_names (job_id TEXT, image_name TEXT, PRIMARY KEY (job_id, image_name)) WITHOUT ROWID",
+    # Chunks of images claimed by headless workers (worker.py) until `expires` (unix time)
+    '''CREATE TABLE IF NOT EXISTS leases (
+        lease_id TEXT PRIMARY KEY,
+        job_id TEXT,
+        owner TEXT,
+        expires REAL,
+        images INTEGER)''',
+    # images/jobs rows changed by any process (filled by TRIGGERS), read by backup.DatabaseBackup
+    "CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT, row_key TEXT)",
+]
+
+# Columns added after the first release, created on databases that predate them
+MIGRATIONS = [
+    ('images', 'lease_id', 'TEXT'),
+    ('images', 'attempts', 'INTEGER DEFAULT 0'),
+    # Jobs submitted from the UI for the runner (python -m engine): status is NULL until submitted,
+    # then 'queued', 'running', 'done' or 'cancelled'
+    ('jobs', 'status', 'TEXT'),
+    ('jobs', 'confidence', 'REAL'),
+    ('jobs', 'output_images', 'TEXT'),
+    ('jobs', 'output_labels', 'TEXT'),
+    ('jobs', 'submitted', 'REAL'),
+    # Set by the UI to ask the runner, which owns the database backup, for a full snapshot
+    ('jobs', 'backup_requested', 'INTEGER DEFAULT 0'),
+]
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_images_lease ON images (lease_id)",
+]
+# Data changes run once per database, in order, tracked by PRAGMA user_version
+DATA_MIGRATIONS = [
+    # Jobs of databases from before the jobs table was written to only exist as images.job_id;
+    # list them so they can be submitted to the runner
+    "INSERT OR IGNORE INTO jobs (job_id, total_images, completed_batches) "
+    "SELECT job_id, COUNT(*), 0 FROM images WHERE job_id IS NOT NULL GROUP BY job_id",
+]
+# Primary key of each table whose changes are backed up incrementally
+CHANGE_KEYS = {'images': 'image_name', 'jobs': 'job_id'}
+# Lease bookkeeping (lease_id, attempts) and backup flags are not recorded as changes
+TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS images_inserted AFTER INSERT ON images "
+    "BEGIN INSERT INTO changes (table_name, row_key) VALUES ('images', NEW.image_name); END",
+    "CREATE TRIGGER IF NOT EXISTS images_updated AFTER UPDATE OF processed, detections, confidence, "
+    "processed_timestamp, job_id, batch_id ON images "
+    "BEGIN INSERT INTO changes (table_name, row_key) VALUES ('images', NEW.image_name); END",
+    "CREATE TRIGGER IF NOT EXISTS jobs_inserted AFTER INSERT ON jobs "
+    "BEGIN INSERT INTO changes (table_name, row_key) VALUES ('jobs', NEW.job_id); END",
+    "CREATE TRIGGER IF NOT EXISTS jobs_updated AFTER UPDATE OF total_images, completed_batches, status, confidence, "
+    "output_images, output_labels, submitted ON jobs "
+    "BEGIN INSERT INTO changes (table_name, row_key) VALUES ('jobs', NEW.job_id); END",
+]
+
+# Upsert keeps the image's job_id/batch_id (INSERT OR REPLACE would null them out)
+MARK_PROCESSED = '''INSERT INTO images (image_name, processed, detections, confidence, processed_timestamp)
+    VALUES (?, 1, ?, ?, ?)
+    ON CONFLICT(image_name) DO UPDATE SET processed = 1, detections = excluded.detections,
+        confidence = excluded.confidence, processed_timestamp = excluded.processed_timestamp'''
+
+class JobStore:
+    """
+    Thread-safe access to the images/jobs tables through a single connection.
+
+    mark_processed() only appends to an in-memory buffer; the buffer is written in one transaction
+    once it holds flush_rows rows or its oldest row is flush_seconds old (checked on every call and
+    by flush_if_due()). Call flush() before reading results back and close() when done. Triggers
+    record every changed images/jobs row in the changes table, whichever process wrote it
+    (read with changed_rows() by backup.DatabaseBackup).
+    """
+    def __init__(self, path, flush_rows=500, flush_seconds=2.0):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        for table, column, column_type in MIGRATIONS:
+            if column not in {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        for statement in INDEXES + TRIGGERS:
+            self.conn.execute(statement)
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for statement in DATA_MIGRATIONS[version:]:
+            self.conn.execute(statement)
+        self.conn.execute(f"PRAGMA user_version = {max(version, len(DATA_MIGRATIONS))}")
+        self.conn.commit()
+        self._lock = threading.RLock()
+        self._pending = []
+        self._oldest = None
+
+    def execute(self, sql, params=()):
+        """
+        Run a read query and return all rows.
+        """
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def mark_processed(self, image_name, detections, confidence):
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((image_name, bool(detections), float(confidence),
+                                  datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        with self._lock:
+            if self._pending and (len(self._pending) >= self.flush_rows or time.monotonic() - self._oldest >= self.flush_seconds):
+                self.flush()
+
+    def flush(self):
+        """
+        Write all buffered rows in one transaction. Returns the number of rows written.
+        """
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if rows:
+                with self.conn:
+                    self.conn.executemany(MARK_PROCESSED, rows)
+            return len(rows)
+
+    def open_scan(self, prefix, job_id):
+        """
+        Return (job_id, page_token) of an unfinished scan of prefix, or register a new scan under job_id.
+        """
+        with self._lock:
+            rows = self.conn.execute("SELECT job_id, page_token FROM scans WHERE prefix = ?", (prefix,)).fetchall()
+            if rows:
+                return rows[0]
+            with self.conn:
+                self.conn.execute("INSERT INTO scans (job_id, prefix) VALUES (?, ?)", (job_id, prefix))
+            return job_id, None
+
+    def stage_scan_page(self, job_id, names, next_page_token):
+        """
+        Store one listing page and the token of the next one in a single transaction, so an
+        interrupted scan resumes exactly after the last stored page.
+        """
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO scan_names (job_id, image_name) VALUES (?, ?)",
+                                  ((job_id, name) for name in names))
+            self.conn.execute("UPDATE scans SET page_token = ?, pages = pages + 1 WHERE job_id = ?", (next_page_token, job_id))
+
+    def finish_scan(self, job_id):
+        """
+        Queue every scanned image that is not in the images table yet (anti-join) as job_id in one
+        INSERT ... SELECT, then drop the staging rows. Returns the number of queued images.
+        The batch_id column is only kept for databases of the batch-based app; workers claim leased
+        chunks instead.
+        """
+        new_images = ("FROM scan_names s WHERE s.job_id = ? AND NOT EXISTS "
+                      "(SELECT 1 FROM images i WHERE i.image_name = s.image_name)")
+        with self._lock, self.conn:
+            total = self.conn.execute("SELECT COUNT(*) " + new_images, (job_id,)).fetchone()[0]
+            if total:
+                self.conn.execute("INSERT INTO images (image_name, processed, job_id) SELECT image_name, 0, ? " + new_images,
+                                  (job_id, job_id))
+                self.conn.execute("INSERT OR REPLACE INTO jobs (job_id, total_images, completed_batches, submitted) VALUES (?, ?, 0, ?)",
+                                  (job_id, total, time.time()))
+            self.conn.execute("DELETE FROM scan_names WHERE job_id = ?", (job_id,))
+            self.conn.execute("DELETE FROM scans WHERE job_id = ?", (job_id,))
+        return total
+
+    def claim_chunk(self, owner, size, lease_seconds, job_id=None, max_attempts=3):
+        """
+        Lease up to size unprocessed images (of job_id, or of any job) for lease_seconds.
+
+        Images whose lease expired (a worker crashed) or was released while they were still
+        unprocessed are claimable again, up to max_attempts claims per image so an image that
+        always fails cannot loop forever. BEGIN IMMEDIATE makes the claim atomic across processes
+        sharing the database file. Returns (lease_id, image names); names is empty when nothing is left.
+        """
+        now = time.time()
+        lease_id = str(uuid.uuid4())
+        query = ("SELECT image_name FROM images WHERE processed = 0 AND attempts < ? AND (lease_id IS NULL OR NOT EXISTS "
+                 "(SELECT 1 FROM leases l WHERE l.lease_id = images.lease_id AND l.expires >= ?))")
+        params = [max_attempts, now]
+        if job_id:
+            query += " AND job_id = ?"
+            params.append(job_id)
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                names = [row[0] for row in self.conn.execute(query + " LIMIT ?", params + [size])]
+                if names:
+                    self.conn.execute("INSERT INTO leases (lease_id, job_id, owner, expires, images) VALUES (?, ?, ?, ?, ?)",
+                                      (lease_id, job_id, owner, now + lease_seconds, len(names)))
+                    self.conn.executemany("UPDATE images SET lease_id = ?, attempts = attempts + 1 WHERE image_name = ?",
+                                          ((lease_id, name) for name in names))
+                self.conn.execute("DELETE FROM leases WHERE expires < ?", (now,))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return lease_id, names
+
+    def renew_lease(self, lease_id, lease_seconds):
+        """
+        Extend a lease. Returns False if it already expired and may have been claimed by another worker.
+        """
+        with self._lock, self.conn:
+            return self.conn.execute("UPDATE leases SET expires = ? WHERE lease_id = ? AND expires >= ?",
+                                     (time.time() + lease_seconds, lease_id, time.time())).rowcount == 1
+
+    def release_lease(self, lease_id):
+        """
+        Write the chunk's buffered results and drop its lease.
+        """
+        with self._lock:
+            self.flush()
+            with self.conn:
+                self.conn.execute("DELETE FROM leases WHERE lease_id = ?", (lease_id,))
+
+    def job_progress(self, job_id=None):
+        """
+        {'total', 'processed', 'detections', 'leased', 'workers'} for one job or the whole database.
+        """
+        where, params = ("WHERE job_id = ?", (job_id,)) if job_id else ("", ())
+        total, processed, detections = self.execute(
+            f"SELECT COUNT(*), SUM(processed = 1), SUM(detections) FROM images {where}", params)[0]
+        leased, workers = self.execute(
+            f"SELECT SUM(images), COUNT(DISTINCT owner) FROM leases WHERE expires >= ? {'AND job_id = ?' if job_id else ''}",
+            (time.time(),) + params)[0]
+        return {'total': total, 'processed': processed or 0, 'detections': detections or 0,
+                'leased': leased or 0, 'workers': workers}
+
+    def submit_job(self, job_id, confidence, output_images, output_labels):
+        """
+        Queue job_id for the runner with its detection settings (resubmitting a job updates them).
+        Raises ValueError if there is no such job.
+        """
+        with self._lock, self.conn:
+            updated = self.conn.execute("UPDATE jobs SET status = 'queued', confidence = ?, output_images = ?, output_labels = ?, "
+                                        "submitted = ? WHERE job_id = ?",
+                                        (confidence, output_images, output_labels, time.time(), job_id)).rowcount
+        if not updated:
+            raise ValueError(f"Unknown job: {job_id}")
+
+    def set_job_status(self, job_id, status):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE jobs SET status = ? WHERE job_id = ?", (status, job_id))
+
+    def request_backup(self, job_id):
+        """
+        Flag job_id so the job runner, which owns the database backup, takes a full snapshot
+        (see take_backup_requests).
+        """
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE jobs SET backup_requested = 1 WHERE job_id = ?", (job_id,))
+
+    def take_backup_requests(self):
+        """
+        Clear all backup flags. Returns True if any job was flagged.
+        """
+        with self._lock, self.conn:
+            return self.conn.execute("UPDATE jobs SET backup_requested = 0 WHERE backup_requested = 1").rowcount > 0
+
+    def job_status(self, job_id):
+        rows = self.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,))
+        return rows[0][0] if rows else None
+
+    def next_job(self):
+        """
+        The oldest queued or running job as a dict of its settings, or None when there is nothing to run.
+        """
+        rows = self.execute("SELECT job_id, confidence, output_images, output_labels FROM jobs "
+                            "WHERE status IN ('queued', 'running') ORDER BY submitted LIMIT 1")
+        if not rows:
+            return None
+        return dict(zip(('job_id', 'confidence', 'output_images', 'output_labels'), rows[0]))
+
+    def jobs(self):
+        """
+        Every job, newest first, as dicts of job_id, total_images and status (read from the small jobs
+        table, not the images table).
+        """
+        return [dict(zip(('job_id', 'total_images', 'status'), row)) for row in
+                self.execute("SELECT job_id, total_images, status FROM jobs ORDER BY submitted DESC, rowid DESC")]
+
+    def changed_rows(self):
+        """
+        Current content of every images/jobs row changed since the last clear_changes(), read in one
+        transaction. Returns (last change seq or None, [(table, {column: value})]).
+        """
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                last = self.conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0]
+                rows = []
+                if last is not None:
+                    for table, key in CHANGE_KEYS.items():
+                        cursor = self.conn.execute(f"SELECT * FROM {table} WHERE {key} IN "
+                                                   "(SELECT row_key FROM changes WHERE table_name = ? AND seq <= ?)", (table, last))
+                        columns = [column[0] for column in cursor.description]
+                        rows.extend((table, dict(zip(columns, row))) for row in cursor)
+            finally:
+                self.conn.commit()
+        return last, rows
+
+    def clear_changes(self, last_seq):
+        """
+        Forget the changes up to last_seq once they are backed up.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM changes WHERE seq <= ?", (last_seq,))
+
+    def checkpoint(self):
+        """
+        Flush and fold the WAL into the main database file, so copying that file gives a complete database.
+        """
+        with self._lock:
+            self.flush()
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.conn.close()
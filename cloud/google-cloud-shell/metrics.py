@@ -0,0 +1,253 @@
+# metrics.py
+# Live performance metrics for the detector: per-stage latency histograms, throughput, queue depths
+# and CPU/GPU utilization in one process-wide registry (METRICS), exposed as Prometheus text
+# (GET /metrics), as JSON (GET /metrics.json, read by the Streamlit dashboard) and as a periodic
+# JSON log line.
+#
+#   curl localhost:9100/metrics
+
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+import collections
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from prefetch import _percentile
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# download/decode/output/upload are timed per image or object, inference per batch
+STAGES = ('download', 'decode', 'inference', 'output', 'upload')
+
+class Histogram:
+    """
+    Latency histogram: cumulative bucket counts for Prometheus, plus the last `window` observations
+    for p50/p95/p99 that follow the current load instead of the whole process lifetime.
+    """
+    def __init__(self, window=2048):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.items = 0
+        self.sum = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+    def observe(self, seconds, n=1):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.items += n
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def summary(self):
+        recent = list(self.recent)
+        return {
+            'count': self.count,
+            'items': self.items,
+            'seconds': self.sum,
+            'p50': _percentile(recent, 0.50),
+            'p95': _percentile(recent, 0.95),
+            'p99': _percentile(recent, 0.99),
+        }
+
+def gpu_stats():
+    """
+    GPU utilization (percent, needs pynvml) and memory of this process, or None without a GPU.
+    torch is only used if the process already imported it, so the UI never loads it.
+    """
+    torch = sys.modules.get('torch')
+    if torch is None or not torch.cuda.is_available():
+        return None
+    stats = {'memory_mb': torch.cuda.memory_allocated() / 1e6, 'memory_reserved_mb': torch.cuda.memory_reserved() / 1e6}
+    try:
+        stats['utilization'] = torch.cuda.utilization()
+    except Exception:
+        stats['utilization'] = None
+    return stats
+
+class Metrics:
+    """
+    Thread-safe registry. observe(stage, seconds, n) matches the observe hook of run_pipeline,
+    Prefetcher and Uploader; count() adds to a named counter; track_queues() and gauge() register
+    values read at snapshot time. Rates (images/s, CPU %) are measured over the last rate_window
+    seconds between snapshots.
+    """
+    def __init__(self, rate_window=10.0):
+        self.rate_window = rate_window
+        self._lock = threading.Lock()
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.counters = collections.Counter()
+        self.queues = {}
+        self.gauges = {}
+        self._samples = collections.deque()
+        self.start = time.time()
+
+    def observe(self, stage, seconds, n=1):
+        with self._lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(seconds, n)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def track_queues(self, queues):
+        """
+        Report the depth of these queue.Queue objects (e.g. the queues dict of run_pipeline).
+        """
+        with self._lock:
+            self.queues = queues
+
+    def gauge(self, name, function):
+        with self._lock:
+            self.gauges[name] = function
+
+    def _rates(self, images, cpu_seconds):
+        now = time.monotonic()
+        self._samples.append((now, images, cpu_seconds))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.rate_window:
+            self._samples.popleft()
+        then, images_then, cpu_then = self._samples[0]
+        if now - then <= 0:
+            return 0.0, 0.0
+        return (images - images_then) / (now - then), 100 * (cpu_seconds - cpu_then) / (now - then)
+
+    def snapshot(self):
+        """
+        All metrics as one JSON-serializable dict.
+        """
+        times = os.times()
+        cpu_seconds = times.user + times.system
+        with self._lock:
+            stages = {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+            queues = {name: {'depth': q.qsize(), 'max': q.maxsize} for name, q in self.queues.items()}
+            gauges = dict(self.gauges)
+            images_per_s, cpu_percent = self._rates(stages['output']['items'], cpu_seconds)
+        values = {}
+        for name, function in gauges.items():
+            try:
+                values[name] = function()
+            except Exception:
+                values[name] = None
+        return {
+            'time': time.time(),
+            'uptime_s': time.time() - self.start,
+            'images': stages['output']['items'],
+            'images_per_s': images_per_s,
+            'cpu_percent': cpu_percent,
+            'cpu_seconds': cpu_seconds,
+            'load_1m': os.getloadavg()[0] if hasattr(os, 'getloadavg') else None,
+            'gpu': gpu_stats(),
+            'stages': stages,
+            'queues': queues,
+            'gauges': values,
+            'counters': counters,
+        }
+
+    def prometheus(self):
+        """
+        The snapshot in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        with self._lock:
+            histograms = {stage: (list(histogram.buckets), histogram.sum, histogram.count)
+                          for stage, histogram in self.histograms.items()}
+        lines = ['# HELP fish_stage_seconds Time per call of each pipeline stage (inference per batch)',
+                 '# TYPE fish_stage_seconds histogram']
+        for stage, (buckets, total, count) in histograms.items():
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket_count
+                lines.append(f'fish_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'fish_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'fish_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines += ['# HELP fish_stage_items_total Images (or objects) through each pipeline stage',
+                  '# TYPE fish_stage_items_total counter']
+        lines += [f'fish_stage_items_total{{stage="{stage}"}} {summary["items"]}' for stage, summary in snapshot['stages'].items()]
+        lines += ['# TYPE fish_images_per_second gauge', f"fish_images_per_second {snapshot['images_per_s']}",
+                  '# TYPE fish_process_cpu_seconds_total counter', f"fish_process_cpu_seconds_total {snapshot['cpu_seconds']}",
+                  '# HELP fish_queue_depth Entries waiting in the queue after each pipeline stage',
+                  '# TYPE fish_queue_depth gauge']
+        lines += [f'fish_queue_depth{{queue="{name}"}} {q["depth"]}' for name, q in snapshot['queues'].items()]
+        lines += ['# TYPE fish_gauge gauge']
+        lines += [f'fish_gauge{{name="{name}"}} {value}' for name, value in snapshot['gauges'].items() if value is not None]
+        lines += ['# TYPE fish_events_total counter']
+        lines += [f'fish_events_total{{name="{name}"}} {value}' for name, value in snapshot['counters'].items()]
+        gpu = snapshot['gpu']
+        if gpu:
+            lines += ['# TYPE fish_gpu_memory_bytes gauge', f"fish_gpu_memory_bytes {gpu['memory_mb'] * 1e6:.0f}"]
+            if gpu['utilization'] is not None:
+                lines += ['# TYPE fish_gpu_utilization_percent gauge', f"fish_gpu_utilization_percent {gpu['utilization']}"]
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry used by engine.process_images
+METRICS = Metrics()
+
+def serve(metrics, port, host=''):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json on a daemon thread. Returns the server.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/metrics.json'):
+                body, content_type = json.dumps(metrics.snapshot()).encode(), 'application/json'
+            elif self.path.startswith('/metrics'):
+                body, content_type = metrics.prometheus().encode(), 'text/plain; version=0.0.4'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+def log_periodically(metrics, interval, stop_event=None):
+    """
+    Log one JSON line with the snapshot every interval seconds on a daemon thread.
+    """
+    stop_event = stop_event or threading.Event()
+
+    def loop():
+        while not stop_event.wait(interval):
+            logging.info("metrics " + json.dumps(metrics.snapshot()))
+
+    threading.Thread(target=loop, name='metrics-log', daemon=True).start()
+    return stop_event
+
+def start_exporters(metrics, port, log_seconds):
+    """
+    Start the HTTP endpoint (port 0 disables it) and the periodic log line (log_seconds 0 disables
+    it). A port already taken (another worker on the same machine) only logs a warning.
+    """
+    if port:
+        try:
+            serve(metrics, port)
+            logging.info(f"Metrics at http://localhost:{port}/metrics")
+        except OSError as e:
+            logging.warning(f"Metrics endpoint not started on port {port}: {e}")
+    if log_seconds:
+        log_periodically(metrics, log_seconds)
+
+def fetch_snapshot(url, timeout=0.5):
+    """
+    A snapshot from another process's /metrics.json, or None if it is not reachable.
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    except Exception:
+        return None
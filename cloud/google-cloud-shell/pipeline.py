@@ -0,0 +1,213 @@
+# pipeline.py
+# Staged download -> decode -> batched inference -> output pipeline for the fish detector.
+# Every stage runs on its own threads and hands work to the next one through a bounded queue,
+# so a slow stage applies backpressure instead of letting images pile up in memory.
+
+import time
+import queue
+import logging
+import threading
+
+_DONE = object()
+
+class PipelineStats:
+    """
+    Thread-safe counters for each pipeline stage.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'downloaded': 0, 'decoded': 0, 'inferred': 0, 'handled': 0, 'failed': 0, 'batches': 0}
+        self.start = time.perf_counter()
+
+    def add(self, key, n=1):
+        with self._lock:
+            self.counts[key] += n
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counts)
+        snapshot['seconds'] = time.perf_counter() - self.start
+        snapshot['images_per_s'] = snapshot['handled'] / max(snapshot['seconds'], 1e-9)
+        return snapshot
+
+def _run_workers(target, count, name):
+    threads = [threading.Thread(target=target, name=f"{name}-{i}", daemon=True) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def run_pipeline(items, download, decode, predict, handle, batch_size=16, batch_timeout=0.05,
+                 download_workers=8, decode_workers=4, output_workers=1, queue_size=64,
+                 on_progress=None, progress_interval=1.0, stop_event=None, queues=None, observe=None):
+    """
+    Run items through download -> decode -> predict -> handle and block until all are done.
+
+    download(item) -> payload, decode(item, payload) -> image array,
+    predict([images]) -> [results] (one call per batch of up to batch_size decoded images),
+    handle(item, payload, image, result) -> None.
+    Returning None from download or decode, or raising, skips the item. With download=None, items
+    must already be (item, payload) pairs (e.g. from a Prefetcher) and are fed in by one thread.
+    Each queue between stages holds at most queue_size entries, which bounds memory.
+    on_progress(stats snapshot) is called from the calling thread every progress_interval seconds
+    (safe for Streamlit). Set stop_event to stop early; queued items are dropped. queues, if a
+    dict, receives the stage queues so callers can report their depth. If set, observe(stage,
+    seconds, n) is called after every download, decode, predict (n = batch size) and handle call,
+    with stage 'download', 'decode', 'inference' or 'output'. Returns the final stats snapshot.
+    """
+    stats = PipelineStats()
+    if download is None:
+        download_workers = 1
+    stop_event = stop_event or threading.Event()
+    downloaded = queue.Queue(maxsize=queue_size)
+    decoded = queue.Queue(maxsize=queue_size)
+    inferred = queue.Queue(maxsize=queue_size)
+    if queues is not None:
+        queues.update({'download': downloaded, 'decode': decoded, 'output': inferred})
+
+    def timed(stage, function, *args, n=1):
+        if observe is None:
+            return function(*args)
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            observe(stage, time.perf_counter() - start, n)
+
+    source = iter(items)
+    source_lock = threading.Lock()
+
+    def put(q, value):
+        # Blocking put that still notices stop_event
+        while not stop_event.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def take(q):
+        # Blocking get that returns _DONE once stop_event is set
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if stop_event.is_set():
+                    return _DONE
+
+    def finish_stage(q, remaining, lock, consumers):
+        # The last producer of a stage tells every consumer of the next stage to stop
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(consumers):
+                put(q, _DONE)
+
+    download_left, download_lock = [download_workers], threading.Lock()
+    decode_left, decode_lock = [decode_workers], threading.Lock()
+
+    def download_loop():
+        try:
+            while not stop_event.is_set():
+                with source_lock:
+                    item = next(source, _DONE)
+                if item is _DONE:
+                    break
+                if download is None:
+                    item, payload = item
+                else:
+                    try:
+                        payload = timed('download', download, item)
+                    except Exception as e:
+                        logging.error(f"Failed to download {item}: {e}")
+                        payload = None
+                if payload is None:
+                    stats.add('failed')
+                    continue
+                stats.add('downloaded')
+                if not put(downloaded, (item, payload)):
+                    break
+        finally:
+            finish_stage(downloaded, download_left, download_lock, decode_workers)
+
+    def decode_loop():
+        try:
+            while True:
+                entry = take(downloaded)
+                if entry is _DONE:
+                    break
+                item, payload = entry
+                try:
+                    image = timed('decode', decode, item, payload)
+                except Exception as e:
+                    logging.error(f"Failed to decode {item}: {e}")
+                    image = None
+                if image is None:
+                    stats.add('failed')
+                    continue
+                stats.add('decoded')
+                if not put(decoded, (item, payload, image)):
+                    break
+        finally:
+            finish_stage(decoded, decode_left, decode_lock, 1)
+
+    def inference_loop():
+        finished = False
+        try:
+            while not finished and not stop_event.is_set():
+                batch = [take(decoded)]
+                if batch[0] is _DONE:
+                    break
+                deadline = time.perf_counter() + batch_timeout
+                while len(batch) < batch_size:
+                    try:
+                        entry = decoded.get(timeout=max(0.0, deadline - time.perf_counter()))
+                    except queue.Empty:
+                        break
+                    if entry is _DONE:
+                        finished = True
+                        break
+                    batch.append(entry)
+                try:
+                    results = timed('inference', predict, [image for _, _, image in batch], n=len(batch))
+                except Exception as e:
+                    logging.error(f"Inference failed for a batch of {len(batch)} images: {e}")
+                    stats.add('failed', len(batch))
+                    continue
+                stats.add('batches')
+                stats.add('inferred', len(batch))
+                for (item, payload, image), result in zip(batch, results):
+                    if not put(inferred, (item, payload, image, result)):
+                        return
+        finally:
+            for _ in range(output_workers):
+                put(inferred, _DONE)
+
+    def output_loop():
+        while True:
+            entry = take(inferred)
+            if entry is _DONE:
+                break
+            item, payload, image, result = entry
+            try:
+                timed('output', handle, item, payload, image, result)
+                stats.add('handled')
+            except Exception as e:
+                logging.error(f"Failed to process {item}: {e}")
+                stats.add('failed')
+
+    threads = (_run_workers(download_loop, download_workers, 'download')
+               + _run_workers(decode_loop, decode_workers, 'decode')
+               + _run_workers(inference_loop, 1, 'inference')
+               + _run_workers(output_loop, output_workers, 'output'))
+
+    while any(thread.is_alive() for thread in threads):
+        if on_progress:
+            on_progress(stats.snapshot())
+        for thread in threads:
+            thread.join(timeout=progress_interval / len(threads))
+    snapshot = stats.snapshot()
+    if on_progress:
+        on_progress(snapshot)
+    return snapshot
@@ -0,0 +1,60 @@
+# postprocess.py
+# Turn Ultralytics results into plain NumPy arrays once, then do all normalization, thresholding
+# and label formatting as vectorized array operations.
+
+import io
+import os
+
+import numpy as np
+
+# Columns of a detections array
+DETECTION_COLUMNS = ('class_id', 'x_center', 'y_center', 'width', 'height', 'confidence')
+LABEL_FORMAT = '%d %.6f %.6f %.6f %.6f'
+
+def detections_array(result):
+    """
+    (n, 6) float32 array of class_id, normalized x_center, y_center, width, height and confidence
+    for one Ultralytics result. Each boxes tensor (xywhn, cls, conf) is copied off the device once
+    instead of one sync per box and value; the named accessors stay correct when boxes.data also
+    carries a track id column.
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    detections = np.empty((len(boxes), 6), dtype=np.float32)
+    detections[:, 0] = boxes.cls.cpu().numpy()
+    detections[:, 1:5] = boxes.xywhn.cpu().numpy()
+    detections[:, 5] = boxes.conf.cpu().numpy()
+    return detections
+
+def above_threshold(detections, confidence):
+    return detections[detections[:, 5] >= confidence]
+
+def max_confidence(detections):
+    return float(detections[:, 5].max()) if len(detections) else 0.0
+
+def format_yolo_labels(detections):
+    """
+    YOLO label text (class x_center y_center width height per line) for a detections array, written in one call.
+    """
+    buffer = io.StringIO()
+    np.savetxt(buffer, detections[:, :5], fmt=LABEL_FORMAT)
+    return buffer.getvalue()
+
+def label_name(image_name):
+    """
+    Name of the YOLO label file for an image in the labels folder.
+    """
+    return os.path.splitext(os.path.basename(image_name))[0] + '.txt'
+
+def stack_detections(image_names, detections_list):
+    """
+    Combine per-image detections into one columnar dict: image_name (one entry per box) plus one
+    array per DETECTION_COLUMNS entry, as written to Parquet by detection_store.DetectionWriter.
+    """
+    counts = [len(detections) for detections in detections_list]
+    stacked = np.concatenate(detections_list) if detections_list else np.zeros((0, 6), dtype=np.float32)
+    columns = {'image_name': np.repeat(np.asarray(image_names, dtype=object), counts)}
+    for i, name in enumerate(DETECTION_COLUMNS):
+        columns[name] = stacked[:, i].astype(np.int32) if name == 'class_id' else stacked[:, i]
+    return columns
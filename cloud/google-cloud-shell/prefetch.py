@@ -0,0 +1,143 @@
+# prefetch.py
+# Concurrent blob prefetcher: keeps up to max_in_flight downloads running ahead of the consumer,
+# bounded by a byte budget, with retries and per-blob latency statistics.
+
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Errors that will not go away by retrying (names match google.api_core.exceptions)
+NON_RETRYABLE = ('NotFound', 'Forbidden', 'Unauthorized', 'FileNotFoundError', 'PermissionError')
+
+def is_retryable(error):
+    return type(error).__name__ not in NON_RETRYABLE
+
+def backoff_delay(attempt, backoff, max_backoff):
+    """
+    Exponential backoff with jitter: between half and all of backoff * 2**attempt, capped at max_backoff.
+    """
+    return min(max_backoff, backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+class Prefetcher:
+    """
+    Iterate over (name, bytes) for every blob name, downloading ahead on a thread pool.
+
+    Up to max_in_flight downloads run at once, fewer when that many payloads of the average size
+    seen so far would exceed max_bytes, so large images cannot blow up memory. Failed downloads
+    are retried `retries` times with exponential backoff (backoff * 2**attempt seconds, with
+    jitter, capped at max_backoff); a blob that still fails is yielded as (name, None). Payloads are yielded in completion order, so one
+    slow blob never holds up the rest. If set, observe('download', seconds, 1) is called for every blob.
+    """
+    def __init__(self, bucket, names, max_in_flight=16, max_bytes=256 << 20, retries=4, backoff=0.25, max_backoff=8.0,
+                 observe=None):
+        self.bucket = bucket
+        self.names = names
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.observe = observe
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.counts = {'downloaded': 0, 'failed': 0, 'retries': 0, 'bytes': 0}
+        self.in_flight = 0
+        self.start = None
+
+    def fetch(self, name):
+        """
+        Download one blob with retries. Returns (name, bytes or None, seconds).
+        """
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                data = self.bucket.blob(name).download_as_bytes()
+                return name, data, time.perf_counter() - start
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.retries:
+                    logging.error(f"Failed to download {name} after {attempt + 1} attempts: {e}")
+                    return name, None, time.perf_counter() - start
+                with self._lock:
+                    self.counts['retries'] += 1
+                time.sleep(backoff_delay(attempt, self.backoff, self.max_backoff))
+
+    def window(self):
+        """
+        Number of downloads allowed in flight given the byte budget and the mean payload size.
+        """
+        with self._lock:
+            mean_size = self.counts['bytes'] / self.counts['downloaded'] if self.counts['downloaded'] else 0
+        if not mean_size:
+            return self.max_in_flight
+        return max(1, min(self.max_in_flight, int(self.max_bytes // mean_size)))
+
+    def __iter__(self):
+        self.start = time.perf_counter()
+        names = iter(self.names)
+        pending = set()
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            while True:
+                # Top up the in-flight window while the estimated bytes in flight fit the budget
+                while not exhausted and len(pending) < self.window():
+                    name = next(names, None)
+                    if name is None:
+                        exhausted = True
+                        break
+                    pending.add(executor.submit(self.fetch, name))
+                self.in_flight = len(pending)
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, data, seconds = future.result()
+                    if self.observe:
+                        self.observe('download', seconds, 1)
+                    with self._lock:
+                        self.latencies.append(seconds)
+                        if data is None:
+                            self.counts['failed'] += 1
+                        else:
+                            self.counts['downloaded'] += 1
+                            self.counts['bytes'] += len(data)
+                    yield name, data
+
+    def stats(self):
+        """
+        Download counters plus p50/p95/max per-blob latency (seconds, including retries) and MB/s.
+        """
+        with self._lock:
+            stats = dict(self.counts)
+            latencies = list(self.latencies)
+        seconds = time.perf_counter() - self.start if self.start else 0.0
+        stats.update({
+            'in_flight': self.in_flight,
+            'seconds': seconds,
+            'latency_p50': _percentile(latencies, 0.50),
+            'latency_p95': _percentile(latencies, 0.95),
+            'latency_max': max(latencies) if latencies else 0.0,
+            'mb_per_s': stats['bytes'] / max(seconds, 1e-9) / 1e6,
+        })
+        return stats
+
+if __name__ == '__main__':
+    # Benchmark: python prefetch.py <bucket or local folder> <prefix> [max_in_flight]
+    # A local folder is read through LocalBucket, so this also runs without GCS credentials.
+    import os
+    import sys
+    from storage_backend import LocalBucket, open_bucket
+    source, prefix = sys.argv[1], sys.argv[2]
+    bucket = LocalBucket(source, float(os.environ.get("STORAGE_LATENCY", 0))) if os.path.isdir(source) else open_bucket(source)
+    names = [blob.name for blob in bucket.list_blobs(prefix=prefix)]
+    prefetcher = Prefetcher(bucket, names, max_in_flight=int(sys.argv[3]) if len(sys.argv) > 3 else 16)
+    for _ in prefetcher:
+        pass
+    print(prefetcher.stats())
@@ -0,0 +1,35 @@
+# scanner.py
+# Discover images in the bucket that the job database has not seen yet, in bounded memory.
+
+import time
+import uuid
+import logging
+
+IMAGE_EXTENSIONS = ('.jpg', '.png')
+
+def scan_new_images(store, bucket, prefix, page_size=1000, extensions=IMAGE_EXTENSIONS, on_page=None):
+    """
+    List every blob under prefix page by page into the store's staging table, then queue the ones
+    not in the images table yet as a new job (one anti-join INSERT).
+
+    Only one page of names is held in memory. The next page token is saved with each page, so a
+    scan interrupted by a crash or restart resumes where it stopped (with the same job id) the next
+    time it is run for the same prefix. on_page(pages, names) reports progress.
+    Returns (job_id, images queued).
+    """
+    job_id, page_token = store.open_scan(prefix, str(uuid.uuid4()))
+    if page_token:
+        logging.info(f"Resuming scan of {prefix} for job {job_id}")
+    start = time.perf_counter()
+    pages = names = 0
+    listing = bucket.list_blobs(prefix=prefix, page_token=page_token, page_size=page_size)
+    for page in listing.pages:
+        batch = [blob.name for blob in page if blob.name.lower().endswith(extensions)]
+        store.stage_scan_page(job_id, batch, listing.next_page_token)
+        pages += 1
+        names += len(batch)
+        if on_page:
+            on_page(pages, names)
+    queued = store.finish_scan(job_id)
+    logging.info(f"Scanned {names} images in {pages} pages ({time.perf_counter() - start:.1f}s); {queued} new images queued as job {job_id}")
+    return job_id, queued
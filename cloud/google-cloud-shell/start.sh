@@ -1,12 +1,19 @@
 #!/bin/bash
 
-# Attempt to download the SQLite database if it exists
+# Attempt to restore the SQLite database (latest snapshot + change-log segments) if it exists
 echo "Checking for existing database..."
-if wget -O /app/processed_images.db https://storage.googleapis.com/nmfs_odp_pifsc/PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/logs/processed_images.db; then
+DATASET=PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2
+if python /app/backup.py nmfs_odp_pifsc $DATASET/logs/processed_images.db $DATASET/database/changes/ /app/processed_images.db; then
+    echo "Database restored successfully."
+elif wget -O /app/processed_images.db https://storage.googleapis.com/nmfs_odp_pifsc/PIFSC/ESD/ARP/pifsc-ai-data-repository/fish-detection/MOUSS_fish_detection_v1/datasets/large_2016_dataset/datasetv2/logs/processed_images.db; then
     echo "Database downloaded successfully."
 else
     echo "Database not found, initializing a new one upon processing."
 fi
 
+# Start the job runner in the background (restarted if it exits); it loads the model once and
+# processes the jobs submitted from the app, independent of any browser session
+(while true; do python -m engine; echo "Job runner exited, restarting in 5s..."; sleep 5; done) &
+
 # Start the Streamlit app
 streamlit run app.py --server.port=8080 --server.enableCORS=false --server.enableXsrfProtection=false
@@ -0,0 +1,124 @@
+# storage_backend.py
+# Bucket access for the fish detector. open_bucket() returns a Google Cloud Storage bucket, or,
+# when STORAGE_ROOT is set, a LocalBucket that mirrors the same small API on a local folder so the
+# pipeline can be run and benchmarked without credentials or network access.
+
+import os
+import time
+import shutil
+
+class LocalBlob:
+    """
+    Filesystem stand-in for google.cloud.storage.Blob (only the methods the app uses).
+    """
+    def __init__(self, bucket, name, size=None):
+        self.bucket = bucket
+        self.name = name
+        self.size = size
+
+    @property
+    def path(self):
+        return os.path.join(self.bucket.root, self.name)
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def download_as_bytes(self):
+        self.bucket.simulate_latency()
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def _write(self, data):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, self.path)
+        self.size = len(data)
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket.simulate_latency()
+        self._write(data.encode() if isinstance(data, str) else data)
+
+    def upload_from_filename(self, filename, content_type=None):
+        with open(filename, 'rb') as file:
+            self.upload_from_string(file.read(), content_type)
+
+    def delete(self):
+        os.remove(self.path)
+
+class LocalBucket:
+    """
+    Filesystem stand-in for google.cloud.storage.Bucket rooted at a local folder. Object names map
+    to relative paths. latency (seconds) is added to every download/upload to mimic network round trips.
+    """
+    def __init__(self, root, latency=0.0):
+        self.root = root
+        self.name = os.path.basename(os.path.normpath(root))
+        self.latency = latency
+
+    def simulate_latency(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def list_blobs(self, prefix='', page_token=None, page_size=1000):
+        return LocalBlobListing(self, prefix, page_token, page_size)
+
+    def copy_blob(self, blob, destination_bucket, new_name=None):
+        self.simulate_latency()
+        destination = destination_bucket.blob(new_name or blob.name)
+        os.makedirs(os.path.dirname(destination.path) or '.', exist_ok=True)
+        shutil.copyfile(blob.path, destination.path)
+        return destination
+
+class LocalBlobListing:
+    """
+    Paged blob listing in name order, like the GCS list_blobs iterator: iterate for blobs, or over
+    .pages for lists of blobs; next_page_token (the last name returned) resumes after the current page.
+    """
+    def __init__(self, bucket, prefix, page_token, page_size):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.next_page_token = page_token
+        self.page_size = page_size
+
+    def _names(self):
+        names = []
+        for folder, _, files in os.walk(self.bucket.root):
+            for file_name in files:
+                name = os.path.relpath(os.path.join(folder, file_name), self.bucket.root).replace(os.sep, '/')
+                if name.startswith(self.prefix) and not name.endswith('.tmp'):
+                    names.append(name)
+        return sorted(names)
+
+    @property
+    def pages(self):
+        names = [name for name in self._names() if not self.next_page_token or name > self.next_page_token]
+        for start in range(0, len(names), self.page_size):
+            page = names[start:start + self.page_size]
+            self.next_page_token = page[-1] if start + self.page_size < len(names) else None
+            yield [LocalBlob(self.bucket, name, os.path.getsize(os.path.join(self.bucket.root, name))) for name in page]
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+def open_bucket(bucket_name, pool_size=None):
+    """
+    Return the bucket to read from and write to: a LocalBucket under $STORAGE_ROOT/<bucket_name>
+    when STORAGE_ROOT is set (optionally with STORAGE_LATENCY seconds per request), else the GCS bucket.
+    pool_size sizes the GCS client's HTTP connection pool (the requests default of 10 makes extra
+    download/upload threads wait for a free connection).
+    """
+    root = os.environ.get("STORAGE_ROOT")
+    if root:
+        return LocalBucket(os.path.join(root, bucket_name), float(os.environ.get("STORAGE_LATENCY", 0)))
+    from google.cloud import storage
+    client = storage.Client()
+    if pool_size:
+        from requests.adapters import HTTPAdapter
+        client._http.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return client.bucket(bucket_name)
@@ -0,0 +1,211 @@
+# uploader.py
+# Background upload stage for detection outputs: uploads run on a thread pool sharing one
+# (connection-pooled) bucket client, so inference never waits on a PUT round trip.
+
+import io
+import json
+import time
+import uuid
+import logging
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from prefetch import is_retryable, backoff_delay
+
+class Uploader:
+    """
+    Upload in-memory bytes/strings to a bucket on `workers` threads.
+
+    submit() returns immediately unless max_pending uploads are already queued, in which case it
+    blocks (backpressure). Failed uploads are retried with exponential backoff. close() (or leaving
+    a `with` block) waits until every queued upload has finished. If set, observe('upload', seconds, 1)
+    is called for every finished upload, copy or delete (seconds include retries).
+    """
+    def __init__(self, bucket, workers=8, max_pending=256, retries=3, backoff=0.5, max_backoff=8.0, observe=None):
+        self.bucket = bucket
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.observe = observe
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.counts = {'uploaded': 0, 'copied': 0, 'deleted': 0, 'failed': 0, 'retries': 0, 'bytes': 0}
+
+    def _run(self, name, action, nbytes, key):
+        start = time.perf_counter()
+        try:
+            return self._attempt(name, action, nbytes, key)
+        finally:
+            with self._lock:
+                self.pending -= 1
+            if self.observe:
+                self.observe('upload', time.perf_counter() - start, 1)
+
+    def _attempt(self, name, action, nbytes, key):
+        for attempt in range(self.retries + 1):
+            try:
+                action()
+                with self._lock:
+                    self.counts[key] += 1
+                    self.counts['bytes'] += nbytes
+                return True
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.retries:
+                    logging.error(f"Failed to write {name} to GCS: {e}")
+                    with self._lock:
+                        self.counts['failed'] += 1
+                    return False
+                with self._lock:
+                    self.counts['retries'] += 1
+                time.sleep(backoff_delay(attempt, self.backoff, self.max_backoff))
+
+    def _submit(self, name, action, nbytes, key='uploaded'):
+        self._slots.acquire()
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(self._run, name, action, nbytes, key)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit(self, name, data, content_type=None):
+        """
+        Queue one upload of data (bytes or str) to blob `name`. Returns a future resolving to True on success.
+        """
+        return self._submit(name, lambda: self.bucket.blob(name).upload_from_string(data, content_type=content_type), len(data))
+
+    def submit_copy(self, source_name, name):
+        """
+        Queue a server-side copy of blob source_name to `name` in the same bucket; no bytes pass
+        through this machine. Returns a future resolving to True on success.
+        """
+        return self._submit(name, lambda: self.bucket.copy_blob(self.bucket.blob(source_name), self.bucket, name), 0, 'copied')
+
+    def submit_delete(self, name):
+        """
+        Queue deletion of blob `name`. Returns a future resolving to True on success.
+        """
+        return self._submit(name, lambda: self.bucket.blob(name).delete(), 0, 'deleted')
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def close(self):
+        """
+        Drain: block until all queued uploads are done.
+        """
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class LabelBundler:
+    """
+    Collect many small label files and upload them as one object per bundle instead of one PUT each.
+
+    format='jsonl' writes one {"name": ..., "label": ...} line per file; format='tar' writes an
+    uncompressed tar of the .txt files (extract with `tar -xf`). A bundle is uploaded to
+    <prefix>labels-<time>-<id>.<ext> once it holds max_files files or is max_seconds old (checked on
+    add), and on close().
+    """
+    def __init__(self, uploader, prefix, format='jsonl', max_files=500, max_seconds=30.0):
+        if format not in ('jsonl', 'tar'):
+            raise ValueError(f"Unknown label bundle format: {format}")
+        self.uploader = uploader
+        self.prefix = prefix
+        self.format = format
+        self.max_files = max_files
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._files = []
+        self._started = time.monotonic()
+        self.bundles = 0
+
+    def add(self, name, text):
+        with self._lock:
+            if not self._files:
+                self._started = time.monotonic()
+            self._files.append((name, text))
+            if len(self._files) < self.max_files and time.monotonic() - self._started < self.max_seconds:
+                return
+            files, self._files = self._files, []
+        self._upload(files)
+
+    def _upload(self, files):
+        if self.format == 'jsonl':
+            data = "".join(json.dumps({'name': name, 'label': text}) + "\n" for name, text in files).encode()
+            content_type = 'application/jsonl'
+        else:
+            buffer = io.BytesIO()
+            with tarfile.open(fileobj=buffer, mode='w') as tar:
+                for name, text in files:
+                    payload = text.encode()
+                    info = tarfile.TarInfo(name)
+                    info.size = len(payload)
+                    info.mtime = int(time.time())
+                    tar.addfile(info, io.BytesIO(payload))
+            data = buffer.getvalue()
+            content_type = 'application/x-tar'
+        bundle_name = f"{self.prefix}labels-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.{self.format}"
+        self.uploader.submit(bundle_name, data, content_type)
+        self.bundles += 1
+
+    def flush(self):
+        with self._lock:
+            files, self._files = self._files, []
+        if files:
+            self._upload(files)
+
+    def close(self):
+        self.flush()
+
+POSITIVE_MODES = ('upload', 'copy', 'manifest')
+
+class PositiveImages:
+    """
+    Put positive images into the output folder.
+
+    mode='upload' re-uploads the bytes already in memory; 'copy' asks the bucket for a server-side
+    copy of the source object (no egress or upload from this machine); 'manifest' moves nothing and
+    records source,destination pairs in <manifest_prefix>positives-<time>-<id>.csv files of up to
+    max_rows rows, written on close() or when full.
+    """
+    def __init__(self, uploader, mode='copy', manifest_prefix='', max_rows=100000):
+        if mode not in POSITIVE_MODES:
+            raise ValueError(f"Unknown positive image mode: {mode}")
+        self.uploader = uploader
+        self.mode = mode
+        self.manifest_prefix = manifest_prefix
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._rows = []
+
+    def add(self, source_name, destination_name, data, content_type=None):
+        if self.mode == 'upload':
+            self.uploader.submit(destination_name, data, content_type)
+        elif self.mode == 'copy':
+            self.uploader.submit_copy(source_name, destination_name)
+        else:
+            with self._lock:
+                self._rows.append((source_name, destination_name))
+                if len(self._rows) < self.max_rows:
+                    return
+                rows, self._rows = self._rows, []
+            self._write_manifest(rows)
+
+    def _write_manifest(self, rows):
+        data = "source,destination\n" + "".join(f"{source},{destination}\n" for source, destination in rows)
+        name = f"{self.manifest_prefix}positives-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.csv"
+        self.uploader.submit(name, data, 'text/csv')
+
+    def close(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if rows:
+            self._write_manifest(rows)
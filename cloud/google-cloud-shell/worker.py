@@ -0,0 +1,97 @@
+# worker.py
+# Headless worker: claims small leased chunks of unprocessed images from the job database and runs
+# them through the detector. Start as many as the hardware allows, e.g.
+#
+#   python worker.py --chunk-size 256 &
+#   python worker.py --chunk-size 256 &
+#
+# Workers on one machine share processed_images.db (SQLite WAL handles concurrent processes).
+# A chunk whose worker dies is claimed again once its lease expires. The database is backed up only
+# by the job runner (python -m engine), whose change segments include the rows workers write.
+
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+
+def run_worker(store, process_chunk, job_id=None, chunk_size=256, lease_seconds=300, owner=None,
+               stop_event=None, follow=False, poll_seconds=10):
+    """
+    Claim chunks from store and call process_chunk(image_names, heartbeat) on each until no work is
+    left (or, with follow=True, until stop_event is set). process_chunk must call heartbeat(...)
+    periodically; it renews the lease every lease_seconds / 3. Returns a summary dict.
+    """
+    owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+    stop_event = stop_event or threading.Event()
+    start = time.perf_counter()
+    chunks = images = 0
+    while not stop_event.is_set():
+        lease_id, names = store.claim_chunk(owner, chunk_size, lease_seconds, job_id)
+        if not names:
+            if not follow:
+                break
+            stop_event.wait(poll_seconds)
+            continue
+
+        renewed = [time.monotonic()]
+
+        def heartbeat(*_):
+            if time.monotonic() - renewed[0] >= lease_seconds / 3:
+                if not store.renew_lease(lease_id, lease_seconds):
+                    logging.warning(f"Lease {lease_id} expired before it could be renewed; another worker may redo this chunk")
+                renewed[0] = time.monotonic()
+
+        process_chunk(names, heartbeat)
+        store.release_lease(lease_id)
+        chunks += 1
+        images += len(names)
+        seconds = time.perf_counter() - start
+        logging.info(f"{owner}: chunk {chunks} done ({len(names)} images); {images} images in {seconds:.0f}s "
+                     f"({images / max(seconds, 1e-9):.1f} images/s)")
+    seconds = time.perf_counter() - start
+    return {'owner': owner, 'chunks': chunks, 'images': images, 'seconds': seconds,
+            'images_per_s': images / max(seconds, 1e-9)}
+
+def main(argv=None):
+    from storage_backend import open_bucket
+    from engine import (BUCKET_NAME, DEFAULT_OUTPUT_IMAGES_GCS, DEFAULT_OUTPUT_LABELS_GCS, DOWNLOAD_WORKERS,
+                        UPLOAD_WORKERS, METRICS_PORT, METRICS_LOG_SECONDS, load_model, open_store, process_images)
+    from metrics import METRICS, start_exporters
+
+    parser = argparse.ArgumentParser(description="Process queued images from the job database with leased chunks.")
+    parser.add_argument('--job', default=None, help="Only process this job id (default: any job)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Images claimed per lease")
+    parser.add_argument('--lease-seconds', type=int, default=300, help="Lease duration; renewed while the chunk runs")
+    parser.add_argument('--confidence', type=float, default=0.65, help="Detection confidence threshold")
+    parser.add_argument('--output-images', default=DEFAULT_OUTPUT_IMAGES_GCS, help="Output prefix for positive images")
+    parser.add_argument('--output-labels', default=DEFAULT_OUTPUT_LABELS_GCS, help="Output prefix for labels")
+    parser.add_argument('--follow', action='store_true', help="Keep polling for new work instead of exiting when idle")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    model, device = load_model()
+    bucket = open_bucket(BUCKET_NAME, pool_size=DOWNLOAD_WORKERS + UPLOAD_WORKERS)
+    store = open_store()
+    logging.info(f"Worker started on {device}")
+    start_exporters(METRICS, METRICS_PORT, METRICS_LOG_SECONDS)
+
+    # SIGTERM/SIGINT finish the current chunk, then exit
+    stop_event = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop_event.set())
+
+    def process_chunk(names, heartbeat):
+        process_images(names, model, bucket, store, None, args.output_images, args.output_labels,
+                       args.confidence, on_progress=heartbeat)
+
+    summary = run_worker(store, process_chunk, args.job, args.chunk_size, args.lease_seconds,
+                         stop_event=stop_event, follow=args.follow)
+    logging.info(f"Worker finished: {summary}")
+    store.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
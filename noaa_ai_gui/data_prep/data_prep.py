@@ -1,22 +1,87 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QFileDialog
+import os
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QFileDialog, QTextEdit
+from PyQt5.QtCore import QThread, pyqtSignal
+from noaa_ai_tools.stats import DatasetStats
+
+class StatsThread(QThread):
+    progress = pyqtSignal(str)
+    finished = pyqtSignal(object)
+
+    def __init__(self, label_folder, image_folder=None):
+        super().__init__()
+        self.label_folder = label_folder
+        self.image_folder = image_folder
+
+    def run(self):
+        try:
+            self.progress.emit(f"Reading label statistics from {self.label_folder}...")
+            stats = DatasetStats(self.label_folder, self.image_folder)
+            # Worker processes cannot be started from a GUI thread on every platform
+            changed = stats.refresh(workers=1)
+            self.progress.emit(f"{changed} label files reparsed, the rest loaded from cache.")
+            self.finished.emit(stats)
+        except Exception as e:
+            self.progress.emit(f"Error: {str(e)}")
+            self.finished.emit(None)
 
 class DataPrepPage(QWidget):
     def __init__(self):
         super().__init__()
+        self.stats_thread = None
         self.init_ui()
 
     def init_ui(self):
         layout = QVBoxLayout()
         layout.addWidget(QLabel("PLACEHOLDER Data Preparation Page PLACEHOLDER. Will include noaa-ai-tools data prep tools later like dataset split, yolo verify, etc"))
-        
+
         # Load dataset button
         self.load_dataset_btn = QPushButton("Load Dataset")
         self.load_dataset_btn.clicked.connect(self.load_dataset)
         layout.addWidget(self.load_dataset_btn)
 
+        # Dataset statistics (class counts, boxes per image, box and image sizes)
+        layout.addWidget(QLabel("Dataset Statistics:"))
+        self.stats_output = QTextEdit()
+        self.stats_output.setReadOnly(True)
+        layout.addWidget(self.stats_output)
+
         self.setLayout(layout)
 
     def load_dataset(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Dataset Folder")
         if folder:
             print(f"Dataset loaded from: {folder}")
+            # Accept either a dataset root with images/ and labels/ or a bare label folder
+            label_folder = os.path.join(folder, 'labels')
+            image_folder = os.path.join(folder, 'images')
+            if not os.path.isdir(label_folder):
+                label_folder, image_folder = folder, None
+            elif not os.path.isdir(image_folder):
+                image_folder = None
+            self.load_dataset_btn.setEnabled(False)
+            self.stats_thread = StatsThread(label_folder, image_folder)
+            self.stats_thread.progress.connect(self.stats_output.append)
+            self.stats_thread.finished.connect(self.show_stats)
+            self.stats_thread.start()
+
+    def show_stats(self, stats):
+        self.load_dataset_btn.setEnabled(True)
+        if stats is None:
+            return
+        summary = stats.summary()
+        lines = [
+            f"Label files: {summary['label_files']} ({summary['background_images']} background)",
+            f"Boxes: {summary['boxes']} (mean {summary['mean_boxes_per_image']:.2f}, max {summary['max_boxes_per_image']} per image)",
+        ]
+        if summary['invalid_class_boxes']:
+            lines.append(f"Boxes with a negative class ID: {summary['invalid_class_boxes']}")
+        lines += ["", "Class   Boxes   Images"]
+        for class_id, boxes in summary['class_counts'].items():
+            lines.append(f"{class_id:>5}   {boxes:>5}   {summary['images_per_class'].get(class_id, 0):>6}")
+        counts, edges = stats.box_size_histogram(bins=10)
+        lines += ["", "Box size (sqrt area, fraction of image):"]
+        lines += [f"  {low:.1f}-{high:.1f}: {count}" for count, low, high in zip(counts, edges[:-1], edges[1:])]
+        if summary['image_sizes']:
+            lines += ["", "Image sizes:"]
+            lines += [f"  {size}: {count}" for size, count in summary['image_sizes'].items()]
+        self.stats_output.setPlainText("\n".join(lines))
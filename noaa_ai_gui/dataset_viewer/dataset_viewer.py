@@ -2,8 +2,11 @@ import os
 import yaml
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QFileDialog, QMessageBox, QGridLayout, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QGraphicsTextItem, QComboBox, QFrame, QSpacerItem, QSizePolicy,QGroupBox)
 from PyQt5.QtGui import QIcon, QPixmap, QPainter, QPen, QColor,QDragEnterEvent, QDropEvent,QImage
-from PyQt5.QtCore import Qt, pyqtSignal, QSize, QUrl
+from PyQt5.QtCore import Qt, pyqtSignal, QSize, QUrl, QThread
 from PyQt5.QtSvg import QSvgRenderer
+from noaa_ai_tools.label_store import LabelStore
+from noaa_ai_tools.dataset_index import user_cache_path
+from noaa_ai_tools.stats import parse_label_boxes
 
 
 def get_colored_svg_icon(path, color):
@@ -21,6 +24,23 @@ def get_colored_svg_icon(path, color):
     painter.end()
     return QIcon(QPixmap.fromImage(colored_image))
 
+class LabelStoreThread(QThread):
+    finished = pyqtSignal(str, object)
+
+    def __init__(self, label_dir):
+        super().__init__()
+        self.label_dir = label_dir
+
+    def run(self):
+        # Compiled store kept in the user cache, not inside the (possibly read-only) dataset folder
+        try:
+            store = LabelStore(self.label_dir, store_dir=user_cache_path(self.label_dir, 'label_store'))
+            store.refresh()
+            self.finished.emit(self.label_dir, store)
+        except Exception as e:
+            print("Label store unavailable, reading label files directly:", e)
+            self.finished.emit(self.label_dir, None)
+
 class ThumbnailLabel(QLabel):
     clicked = pyqtSignal(str)  # Signal to emit the image path
 
@@ -52,6 +72,9 @@ class DatasetViewerPage(QWidget):
         self.current_page = 0
         self.items_per_page = 10
         self.total_images = []
+        self.label_store = None
+        self.label_store_dir = None
+        self.label_store_threads = []
         self.init_ui()
         self.setAcceptDrops(True)  # Enable drag and drop
 
@@ -155,11 +178,14 @@ class DatasetViewerPage(QWidget):
         path = self.dataset_splits.get(self.split_selector.currentText())
         if path and os.path.exists(path):
             self.total_images = [os.path.join(path, f) for f in os.listdir(path) if f.endswith(('.jpg', '.png'))]
+            self.load_label_store(path.replace('images', 'labels'))
             self.thumbnail_group_box.setVisible(True)
             self.split_selector.setVisible(True)
             self.instruction_label.setVisible(True)
         else:
             self.total_images = []
+            self.label_store = None
+            self.label_store_dir = None
             self.thumbnail_group_box.setVisible(False)
             self.split_selector.setVisible(False)
             self.instruction_label.setVisible(False)
@@ -186,24 +212,45 @@ class DatasetViewerPage(QWidget):
                 col = 0
                 row += 1
 
+    def load_label_store(self, label_dir):
+        # Compile the split's labels in the background so thumbnails can read boxes from a
+        # memory-mapped array; until it is ready, the current page's label files are parsed directly
+        self.label_store = None
+        self.label_store_dir = label_dir
+        if os.path.isdir(label_dir):
+            thread = LabelStoreThread(label_dir)
+            thread.finished.connect(self.label_store_ready)
+            self.label_store_threads.append(thread)
+            thread.start()
+
+    def label_store_ready(self, label_dir, store):
+        self.label_store_threads = [thread for thread in self.label_store_threads if thread.isRunning()]
+        # Ignore stores of a split that is no longer selected
+        if label_dir == self.label_store_dir:
+            self.label_store = store
+
+    def read_boxes(self, label_path):
+        stem = os.path.splitext(os.path.basename(label_path))[0]
+        if self.label_store is not None and stem in self.label_store:
+            return self.label_store.boxes(stem)
+        if os.path.exists(label_path):
+            return parse_label_boxes(label_path)
+        return []
+
     def draw_bounding_boxes(self, pixmap, label_path):
         painter = QPainter(pixmap)
         pen = QPen(QColor(255, 0, 0), 2)
         painter.setPen(pen)
 
-        if os.path.exists(label_path):
-            with open(label_path, 'r') as file:
-                lines = file.readlines()
-                for line in lines:
-                    class_id, x_center, y_center, width, height = map(float, line.split())
-                    x_center *= pixmap.width()
-                    y_center *= pixmap.height()
-                    width *= pixmap.width()
-                    height *= pixmap.height()
-
-                    top_left_x = int(x_center - width / 2)
-                    top_left_y = int(y_center - height / 2)
-                    painter.drawRect(top_left_x, top_left_y, int(width), int(height))
+        for class_id, x_center, y_center, width, height in self.read_boxes(label_path):
+            x_center *= pixmap.width()
+            y_center *= pixmap.height()
+            width *= pixmap.width()
+            height *= pixmap.height()
+
+            top_left_x = int(x_center - width / 2)
+            top_left_y = int(y_center - height / 2)
+            painter.drawRect(top_left_x, top_left_y, int(width), int(height))
         painter.end()
         return pixmap
 
@@ -3,22 +3,55 @@
 __all__ = [
     "DeviceManager", "ModelManager", "ModelExporter",  # Core components
     "ensure_dir", "filter_images_with_labels", "create_background_labels",  # Data preparation utilities
-    "validate_yolo_format", "remap_class_ids", "split_dataset"  # More data utilities
+    "validate_yolo_format", "remap_class_ids", "split_dataset",  # More data utilities
+    "materialize_file", "create_empty_labels", "DatasetIndex", "load_class_names",
+    "assign_splits", "deduplicate", "compute_image_hashes", "find_duplicate_groups",
+    "DatasetStats", "tile_dataset", "build_resized_cache",
+    "pack_split", "ShardReader", "LabelStore"
 ]
 
 # Import from the device management module
 from .device_manager import DeviceManager  # Handles device configurations and setup
 
+# Import from the dataset index module
+from .dataset_index import DatasetIndex  # Single-pass map of image/label files by stem
+
 # Import from the data preparation module
 from .dataprep import (
     ensure_dir,  # Ensure directories exist for output
     filter_images_with_labels,  # Filter and copy labeled images
     create_background_labels,  # Create background images and labels
+    create_empty_labels,  # Batch-create empty label files
     validate_yolo_format,  # Check label formats for compliance
+    load_class_names,  # Read class names from a dataset YAML
     remap_class_ids,  # Change class IDs in labels
-    split_dataset  # Divide datasets into training, validation, and test splits
+    split_dataset,  # Divide datasets into training, validation, and test splits
+    assign_splits,  # Stratified, deterministic split assignment
+    materialize_file  # Copy, hardlink, symlink or reflink a single file
+)
+
+# Import from the deduplication module
+from .dedup import (
+    deduplicate,  # Group or drop exact and near-duplicate images
+    compute_image_hashes,  # Cached content + perceptual hashes
+    find_duplicate_groups  # BK-tree near-duplicate grouping
 )
 
+# Import from the dataset statistics module
+from .stats import DatasetStats  # Cached, incremental box/class/image-size statistics
+
+# Import from the tiling module
+from .tiling import tile_dataset  # Multi-scale tiled dataset generator
+
+# Import from the resize cache module
+from .resize_cache import build_resized_cache  # Pre-resized training copy of a dataset
+
+# Import from the shard module
+from .shards import pack_split, ShardReader  # Packed shard writer and memory-mapped reader
+
+# Import from the label store module
+from .label_store import LabelStore  # Memory-mapped compiled labels with per-image lookup
+
 # Import from the model management module
 from .model_manager import ModelManager  # Manages model training and saving
 
@@ -1,8 +1,35 @@
 # dataprep.py
 
 import os
+import sys
+import math
+import time
+import errno
 import shutil
 import random
+import hashlib
+import tempfile
+import subprocess
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+import numpy as np
+import yaml
+
+from .dataset_index import DatasetIndex
+
+SPLIT_MODES = ('copy', 'hardlink', 'symlink', 'reflink', 'manifest')
+
+# Error codes reported by validate_yolo_format, stored as bit flags per file
+LABEL_ERROR_FLAGS = {
+    'read_error': 1 << 0,  # File could not be read
+    'bad_columns': 1 << 1,  # Row is neither "class x y w h" nor a polygon
+    'not_numeric': 1 << 2,  # Row contains a value that is not a number
+    'class_out_of_range': 1 << 3,  # Class ID is negative, fractional or >= number of classes
+    'coord_out_of_range': 1 << 4,  # Coordinate outside [0, 1]
+    'zero_area': 1 << 5,  # Box width/height or polygon area is zero
+    'duplicate_box': 1 << 6,  # Same row appears twice in one file
+}
 
 def ensure_dir(path):
     """
@@ -10,111 +37,681 @@ def ensure_dir(path):
     """
     os.makedirs(path, exist_ok=True)
 
-def filter_images_with_labels(image_folder, label_folder, output_folder, image_formats=None):
+def filter_images_with_labels(image_folder, label_folder, output_folder, image_formats=None, index=None):
     """
     Copy images to the output folder if their corresponding label files exist.
+    Pass a prebuilt DatasetIndex to skip rescanning image_folder and label_folder.
     """
-    if image_formats is None:
-        image_formats = ['.jpg', '.jpeg', '.png']
+    if index is None:
+        index = DatasetIndex(image_folder, label_folder, image_formats)
 
     ensure_dir(output_folder)
-    label_files = [f[:-4] for f in os.listdir(label_folder) if f.endswith(".txt")]
-
-    for label_file in label_files:
-        copied = False
-        for ext in image_formats:
-            image_path = os.path.join(image_folder, label_file + ext)
-            if os.path.exists(image_path):
-                shutil.copy(image_path, os.path.join(output_folder, os.path.basename(image_path)))
-                print(f"Copied: {image_path}")
-                copied = True
-                break
-        if not copied:
-            print(f"No matching image found for {label_file}")
-
-def create_background_labels(background_folder, output_image_folder, output_label_folder, image_formats=None):
+
+    for entry in index.labels():
+        if entry.has_image:
+            shutil.copy(entry.image_path, os.path.join(output_folder, os.path.basename(entry.image_path)))
+            print(f"Copied: {entry.image_path}")
+        else:
+            print(f"No matching image found for {entry.stem}")
+
+class ProgressCounter:
+    """
+    Single-line progress counter that redraws at most every `interval` seconds.
+    Replaces one print per file, which dominates runtime on slow (e.g. Windows) consoles.
+    """
+    def __init__(self, total, label, interval=0.5):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.done = 0
+        self.start = time.perf_counter()
+        self.last_draw = 0.0
+
+    def update(self, n=1):
+        self.done += n
+        now = time.perf_counter()
+        if now - self.last_draw >= self.interval or self.done >= self.total:
+            self.last_draw = now
+            rate = self.done / max(now - self.start, 1e-9)
+            print(f"\r{self.label}: {self.done}/{self.total} ({rate:.0f}/s)", end='', flush=True)
+
+    def close(self):
+        print()
+
+def create_empty_labels(label_paths):
+    """
+    Create (or truncate) empty label files in one tight loop using raw file descriptors.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    for path in label_paths:
+        os.close(os.open(path, flags, 0o644))
+
+def create_background_labels(background_folder, output_image_folder, output_label_folder, image_formats=None, index=None,
+                             mode='copy', workers=8, max_count=None, max_fraction=None, positive_count=None, seed=None):
     """
     Copy background images and create corresponding empty label files.
+    Pass a prebuilt DatasetIndex of background_folder to skip rescanning it.
+
+    mode is 'copy', 'hardlink', 'symlink' or 'reflink' (see materialize_file); images are placed
+    on a pool of `workers` threads. Sampling caps the number of backgrounds: max_count is an
+    absolute cap and max_fraction caps them at a fraction of positive images (e.g. 0.1 for 10%).
+    positive_count defaults to the number of non-empty label files in output_label_folder.
+    seed makes the sample reproducible. Returns the number of background images ingested.
     """
-    if image_formats is None:
-        image_formats = ['.jpg', '.jpeg', '.png']
+    if index is None:
+        index = DatasetIndex(background_folder, image_formats=image_formats)
 
     ensure_dir(output_image_folder)
     ensure_dir(output_label_folder)
 
-    for bg_image in os.listdir(background_folder):
-        ext = os.path.splitext(bg_image)[1].lower()
-        if ext in image_formats:
-            shutil.copy(os.path.join(background_folder, bg_image), os.path.join(output_image_folder, bg_image))
-            empty_label_path = os.path.join(output_label_folder, os.path.splitext(bg_image)[0] + ".txt")
-            open(empty_label_path, 'w').close()
-            print(f"Created empty label for: {bg_image}")
+    entries = index.images()
+    cap = max_count
+    if max_fraction is not None:
+        if positive_count is None:
+            positive_count = sum(1 for entry in DatasetIndex(label_folder=output_label_folder).labels() if entry.label_size > 0)
+        fraction_cap = int(max_fraction * positive_count)
+        cap = fraction_cap if cap is None else min(cap, fraction_cap)
+    if cap is not None and cap < len(entries):
+        entries = sorted(random.Random(seed).sample(entries, cap), key=lambda entry: entry.stem)
+
+    def place(entry):
+        return materialize_file(entry.image_path, os.path.join(output_image_folder, os.path.basename(entry.image_path)), mode)
+
+    start = time.perf_counter()
+    progress = ProgressCounter(len(entries), "Background images")
+    nbytes = 0
+    for size in run_bounded(place, entries, workers):
+        nbytes += size
+        progress.update()
+    create_empty_labels(os.path.join(output_label_folder, entry.stem + ".txt") for entry in entries)
+    progress.close()
+    print(f"Created {len(entries)} background images with empty labels ({len(index.images()) - len(entries)} skipped by sampling): "
+          f"{format_throughput(len(entries), nbytes, time.perf_counter() - start)}")
+    return len(entries)
+
+def load_class_names(data_yaml):
+    """
+    Read the class names from a dataset YAML ('names' as a list or {id: name} dict, or just 'nc').
+    """
+    with open(data_yaml, 'r') as file:
+        config = yaml.safe_load(file)
+    names = config.get('names')
+    if isinstance(names, dict):
+        return [names[key] for key in sorted(names)]
+    if names:
+        return list(names)
+    return [str(i) for i in range(int(config['nc']))]
+
+def _flag_rows(flags, owners, mask, code):
+    if mask.any():
+        np.bitwise_or.at(flags, owners[mask], LABEL_ERROR_FLAGS[code])
+
+def _validate_label_chunk(args):
+    """
+    Validate a chunk of label files in one process. Box rows from every file in the chunk are
+    converted to a single float array so all range checks run as vectorized NumPy operations.
+    """
+    paths, num_classes, allow_segments = args
+    flags = np.zeros(len(paths), dtype=np.int64)
+    box_tokens, box_owners = [], []
+    n_segments = 0
+
+    for i, path in enumerate(paths):
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            flags[i] |= LABEL_ERROR_FLAGS['read_error']
+            continue
+        seen_segments = set()
+        for line in data.splitlines():
+            row = line.split()
+            if not row:
+                continue
+            if len(row) == 5:
+                box_tokens.append(row)
+                box_owners.append(i)
+            elif allow_segments and len(row) >= 7 and len(row) % 2 == 1:
+                n_segments += 1
+                flags[i] |= _check_segment(row, num_classes, seen_segments)
+            else:
+                flags[i] |= LABEL_ERROR_FLAGS['bad_columns']
+
+    owners = np.asarray(box_owners, dtype=np.int64)
+    try:
+        boxes = np.array(box_tokens, dtype=np.float64).reshape(-1, 5)
+    except ValueError:
+        # Slow path only for chunks containing non-numeric tokens
+        keep = []
+        for row_index, row in enumerate(box_tokens):
+            try:
+                [float(token) for token in row]
+                keep.append(row_index)
+            except ValueError:
+                flags[owners[row_index]] |= LABEL_ERROR_FLAGS['not_numeric']
+        owners = owners[keep]
+        boxes = np.array([box_tokens[k] for k in keep], dtype=np.float64).reshape(-1, 5)
+
+    if len(boxes):
+        cls, xywh = boxes[:, 0], boxes[:, 1:]
+        bad_class = (cls != np.floor(cls)) | (cls < 0)
+        if num_classes is not None:
+            bad_class |= cls >= num_classes
+        _flag_rows(flags, owners, bad_class, 'class_out_of_range')
+        _flag_rows(flags, owners, ((xywh < 0) | (xywh > 1) | ~np.isfinite(xywh)).any(axis=1), 'coord_out_of_range')
+        _flag_rows(flags, owners, (xywh[:, 2] <= 0) | (xywh[:, 3] <= 0), 'zero_area')
+
+        keyed = np.column_stack([owners, boxes])
+        ordered = keyed[np.lexsort(keyed.T[::-1])]
+        same_as_prev = np.all(ordered[1:] == ordered[:-1], axis=1)
+        _flag_rows(flags, ordered[1:, 0].astype(np.int64), same_as_prev, 'duplicate_box')
+
+    return flags, len(boxes), n_segments
+
+def _check_segment(row, num_classes, seen_segments):
+    """
+    Validate one segmentation polygon row: class x1 y1 x2 y2 ... (at least three points).
+    """
+    try:
+        values = np.array(row, dtype=np.float64)
+    except ValueError:
+        return LABEL_ERROR_FLAGS['not_numeric']
+    flags = 0
+    cls, points = values[0], values[1:].reshape(-1, 2)
+    if cls != np.floor(cls) or cls < 0 or (num_classes is not None and cls >= num_classes):
+        flags |= LABEL_ERROR_FLAGS['class_out_of_range']
+    if ((points < 0) | (points > 1) | ~np.isfinite(points)).any():
+        flags |= LABEL_ERROR_FLAGS['coord_out_of_range']
+    x, y = points[:, 0], points[:, 1]
+    if abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1))) <= 0:
+        flags |= LABEL_ERROR_FLAGS['zero_area']
+    key = tuple(row)
+    if key in seen_segments:
+        flags |= LABEL_ERROR_FLAGS['duplicate_box']
+    seen_segments.add(key)
+    return flags
 
-def validate_yolo_format(labels_folder):
+def validate_yolo_format(labels_folder, data_yaml=None, num_classes=None, allow_segments=True,
+                         workers=None, chunk_size=2048, index=None, verbose=True):
     """
     Validate that label files conform to the YOLO format.
+
+    Checks column counts, numeric values, class IDs against the dataset YAML (or num_classes),
+    coordinates in [0, 1], zero-area boxes/polygons and duplicate rows. Detection rows
+    (class x y w h) and segmentation polygons (class x1 y1 x2 y2 ...) are both accepted unless
+    allow_segments is False. Files are parsed in chunks across a process pool of `workers`
+    processes (default: all CPUs; 1 runs in-process). Scripts that use the pool on Windows
+    must call this under `if __name__ == "__main__":`.
+    Pass a prebuilt DatasetIndex to skip rescanning labels_folder.
+
+    Returns a report dict:
+        files, boxes, segments, seconds, files_per_s,
+        invalid_files: list of invalid label file names,
+        errors: {file name: [error codes]},
+        counts: {error code: number of files with that error}
+    """
+    if index is None:
+        index = DatasetIndex(label_folder=labels_folder)
+    if data_yaml is not None and num_classes is None:
+        num_classes = len(load_class_names(data_yaml))
+
+    paths = [entry.label_path for entry in index.labels()]
+    chunks = [(paths[i:i + chunk_size], num_classes, allow_segments) for i in range(0, len(paths), chunk_size)]
+
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        results = [_validate_label_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            results = list(executor.map(_validate_label_chunk, chunks))
+    seconds = time.perf_counter() - start
+
+    flags = np.concatenate([result[0] for result in results]) if results else np.zeros(0, dtype=np.int64)
+    report = {
+        'files': len(paths),
+        'boxes': int(sum(result[1] for result in results)),
+        'segments': int(sum(result[2] for result in results)),
+        'seconds': seconds,
+        'files_per_s': len(paths) / max(seconds, 1e-9),
+        'errors': {},
+        'counts': {},
+    }
+    for code, bit in LABEL_ERROR_FLAGS.items():
+        count = int(np.count_nonzero(flags & bit))
+        if count:
+            report['counts'][code] = count
+    for i in np.flatnonzero(flags):
+        report['errors'][os.path.basename(paths[i])] = [code for code, bit in LABEL_ERROR_FLAGS.items() if flags[i] & bit]
+    report['invalid_files'] = list(report['errors'])
+
+    if verbose:
+        if report['invalid_files']:
+            print(f"Invalid label files: {len(report['invalid_files'])} of {report['files']} {report['counts']}")
+        else:
+            print(f"All {report['files']} label files are valid.")
+        print(f"Validated {report['files']} label files in {seconds:.2f}s ({report['files_per_s']:.0f} files/s)")
+    return report
+
+def write_atomic(path, data):
+    """
+    Replace path with data (bytes) via a temp file in the same folder and os.replace, so
+    readers never see a half-written file and hardlinked copies of the old file are untouched.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _remap_label_file(path, mapping, dry_run):
+    """
+    Apply mapping ({old id: new id or None to drop}) to one label file.
+    Returns (changed, rows remapped, rows dropped).
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    lines = data.splitlines()
+    ids = {line.split(None, 1)[0] for line in lines if line.strip()}
+    if ids.isdisjoint(mapping):
+        return False, 0, 0
+
+    remapped = dropped = 0
+    out = []
+    for line in lines:
+        parts = line.split(None, 1)
+        if parts and parts[0] in mapping:
+            new_id = mapping[parts[0]]
+            if new_id is None:
+                dropped += 1
+                continue
+            remapped += 1
+            line = new_id + b" " + parts[1] if len(parts) > 1 else new_id
+        out.append(line)
+    if not dry_run:
+        write_atomic(path, b"".join(line + b"\n" for line in out))
+    return True, remapped, dropped
+
+def remap_class_ids(label_dir, old_id=None, new_id=None, mapping=None, dry_run=False, workers=8, index=None):
+    """
+    Remap class IDs in label files from old_id to new_id, or apply a whole mapping in one pass.
+
+    mapping is a dict of {old id: new id}; a new id of None drops that class's rows.
+    Files without any affected ID are only read, never rewritten, and changed files are replaced
+    atomically. dry_run counts what would change without writing. Files are processed on a pool
+    of `workers` threads. Pass a prebuilt DatasetIndex to skip rescanning label_dir.
+
+    Returns a dict with files, files_changed, rows_remapped and rows_dropped.
+    """
+    if mapping is None:
+        if old_id is None or new_id is None:
+            raise ValueError("Pass either old_id and new_id or a mapping dict")
+        mapping = {old_id: new_id}
+    mapping = {str(old).encode(): (None if new is None else str(new).encode()) for old, new in mapping.items()}
+    if index is None:
+        index = DatasetIndex(label_folder=label_dir)
+
+    paths = [entry.label_path for entry in index.labels()]
+    report = {'files': len(paths), 'files_changed': 0, 'rows_remapped': 0, 'rows_dropped': 0}
+    for changed, remapped, dropped in run_bounded(lambda path: _remap_label_file(path, mapping, dry_run), paths, workers):
+        report['files_changed'] += changed
+        report['rows_remapped'] += remapped
+        report['rows_dropped'] += dropped
+
+    action = "Would change" if dry_run else "Changed"
+    print(f"{action} {report['files_changed']} of {report['files']} label files in {label_dir}: "
+          f"{report['rows_remapped']} rows remapped, {report['rows_dropped']} rows dropped")
+    return report
+
+def _reflink(src, dst):
+    """
+    Clone src into dst with a copy-on-write reflink (btrfs, XFS, APFS).
+    """
+    if sys.platform.startswith('linux'):
+        import fcntl
+        FICLONE = 0x40049409
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    elif sys.platform == 'darwin':
+        # cp -c uses clonefile(2) and fails instead of silently copying
+        subprocess.run(['cp', '-c', src, dst], check=True, capture_output=True)
+    else:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform", src)
+
+def materialize_file(src, dst, mode='copy'):
     """
-    invalid_files = []
-    for label_file in os.listdir(labels_folder):
-        if label_file.endswith(".txt"):
-            with open(os.path.join(labels_folder, label_file), 'r') as file:
-                lines = file.readlines()
-                if not all(len(line.strip().split()) == 5 for line in lines if line.strip()):
-                    invalid_files.append(label_file)
-    
-    if invalid_files:
-        print("Invalid label files:", invalid_files)
+    Place src at dst using the given mode ('copy', 'hardlink', 'symlink' or 'reflink').
+    Hardlinks and reflinks fall back to a plain copy when the filesystem refuses them
+    (e.g. across drives). Returns the number of bytes the file represents.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+    elif mode == 'hardlink':
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+    elif mode == 'reflink':
+        try:
+            _reflink(src, dst)
+        except (OSError, subprocess.CalledProcessError):
+            if os.path.lexists(dst):
+                os.remove(dst)
+            shutil.copyfile(src, dst)
+    elif mode == 'copy':
+        shutil.copy(src, dst)
     else:
-        print("All label files are valid.")
+        raise ValueError(f"Unknown materialization mode: {mode}")
+    return os.path.getsize(src)
+
+def run_bounded(func, items, workers=8):
+    """
+    Apply func to every item on a thread pool, keeping at most a few tasks per worker
+    in flight so huge item lists do not queue millions of futures. Yields results as they finish.
+    """
+    items = iter(items)
+    max_pending = max(1, workers) * 4
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = set()
+        for item in items:
+            pending.add(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+def run_bounded_ordered(func, items, workers=8):
+    """
+    Like run_bounded, but yields results in the order of items (a slow item holds back later
+    results, never more than a few per worker), for output whose layout must be deterministic.
+    """
+    items = iter(items)
+    max_pending = max(1, workers) * 4
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def format_throughput(files, nbytes, seconds):
+    """
+    Format a files/s and MB/s summary for a finished file operation.
+    """
+    seconds = max(seconds, 1e-9)
+    return f"{files / seconds:.1f} files/s, {nbytes / seconds / 1e6:.1f} MB/s"
+
+def read_label_classes(label_path):
+    """
+    Stream a label file line by line and return the set of class IDs it contains. Lines without a
+    numeric class ID are skipped with a warning (validate_yolo_format reports them in detail).
+    """
+    classes = set()
+    malformed = 0
+    with open(label_path, 'rb') as file:
+        for line in file:
+            parts = line.split(None, 1)
+            if parts:
+                try:
+                    classes.add(int(float(parts[0])))
+                except ValueError:
+                    malformed += 1
+    if malformed:
+        print(f"Skipped {malformed} malformed line(s) in {label_path}")
+    return frozenset(classes)
+
+def _split_order_key(seed, stem):
+    # Per-image hash instead of a global shuffle: adding images never reorders existing ones
+    return hashlib.blake2b(f"{seed}:{stem}".encode(), digest_size=8).digest()
 
-def remap_class_ids(label_dir, old_id, new_id):
+def assign_splits(image_classes, ratios, seed, fixed=None, groups=None):
     """
-    Remap class IDs in label files from old_id to new_id.
+    Assign images to splits with iterative multi-label stratification (Sechidis et al., 2011).
+
+    image_classes maps each stem to the set of class IDs in its label (empty for background).
+    ratios maps split name to fraction. Classes are handled rarest first, so every split gets its
+    share of rare species. Assignments in `fixed` ({stem: split}) are kept as-is and counted
+    against each split's quota, so new images fill the gaps without moving existing ones.
+    groups ({stem: group id}, e.g. from deduplicate) forces all images of a group into one split.
+    Ties are broken by a seeded per-image hash, making the result deterministic.
     """
-    for label_file in os.listdir(label_dir):
-        if label_file.endswith(".txt"):
-            with open(os.path.join(label_dir, label_file), 'r') as file:
-                lines = file.readlines()
+    fixed = {stem: split for stem, split in (fixed or {}).items() if stem in image_classes and split in ratios}
+    splits = [name for name, ratio in ratios.items() if ratio > 0]
+    total = len(image_classes)
+
+    # Units are single images, or whole duplicate groups that must land in the same split
+    units = defaultdict(list)
+    for stem in image_classes:
+        units[('group', groups[stem]) if groups and stem in groups else ('image', stem)].append(stem)
+    unit_classes = {key: Counter(c for stem in stems for c in image_classes[stem]) for key, stems in units.items()}
+
+    class_totals = Counter(c for classes in image_classes.values() for c in classes)
+    desired = {name: {c: ratios[name] * n for c, n in class_totals.items()} for name in splits}
+    desired_total = {name: ratios[name] * total for name in splits}
+    assigned = {}
+
+    def place(key, split):
+        for stem in units[key]:
+            assigned[stem] = split
+        if split not in desired_total:
+            return
+        desired_total[split] -= len(units[key])
+        for c, n in unit_classes[key].items():
+            desired[split][c] -= n
 
-            with open(os.path.join(label_dir, label_file), 'w') as file:
-                for line in lines:
-                    parts = line.strip().split()
-                    if parts[0] == str(old_id):
-                        parts[0] = str(new_id)
-                    file.write(" ".join(parts) + "\n")
+    pending = []
+    for key, stems in units.items():
+        pinned = [fixed[stem] for stem in stems if stem in fixed]
+        if pinned:
+            place(key, pinned[0])
+        else:
+            pending.append(key)
+    pending.sort(key=lambda key: min(_split_order_key(seed, stem) for stem in units[key]))
 
-            print(f"Remapped class IDs in {label_file} from {old_id} to {new_id}")
+    by_class = defaultdict(list)
+    for key in pending:
+        for c in unit_classes[key]:
+            by_class[c].append(key)
+    remaining = {c: len(keys) for c, keys in by_class.items()}
+    done = set()
+
+    while any(remaining.values()):
+        rarest = min((c for c, n in remaining.items() if n > 0), key=lambda c: (remaining[c], c))
+        for key in by_class[rarest]:
+            if key in done:
+                continue
+            done.add(key)
+            for c in unit_classes[key]:
+                remaining[c] -= 1
+            place(key, max(splits, key=lambda name: (desired[name][rarest], desired_total[name])))
+    for key in pending:
+        if key not in done:
+            place(key, max(splits, key=lambda name: desired_total[name]))
+    return assigned
+
+def _load_split_assignments(path):
+    """
+    Read split_assignments.tsv written by split_dataset: a settings header and split/stem/image/label rows.
+    """
+    settings, rows = {}, {}
+    if not os.path.exists(path):
+        return settings, rows
+    with open(path, 'r') as file:
+        for line in file:
+            line = line.rstrip("\n")
+            if line.startswith('# '):
+                key, _, value = line[2:].partition('=')
+                settings[key] = value
+            elif line:
+                split, stem, image, label = line.split("\t")
+                rows[stem] = (split, image, label)
+    return settings, rows
+
+def _is_current(src, dst, mode):
+    """
+    True when dst already holds an up-to-date placement of src from a previous run.
+    """
+    try:
+        dst_stat = os.lstat(dst)
+    except FileNotFoundError:
+        return False
+    if mode == 'symlink':
+        return os.path.islink(dst) and os.readlink(dst) == os.path.abspath(src)
+    src_stat = os.stat(src)
+    return dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime >= src_stat.st_mtime
 
-def split_dataset(images_dir, annotations_dir, output_dir, train_ratio=0.7, val_ratio=0.2, test_ratio=0.1):
+def split_dataset(images_dir, annotations_dir, output_dir, train_ratio=0.7, val_ratio=0.2, test_ratio=0.1,
+                  mode='copy', workers=8, index=None, seed=None, stratify=True, groups=None):
     """
     Split dataset into training, validation, and test sets based on specified ratios.
+
+    With stratify=True images are assigned by iterative multi-label stratification over the
+    classes in each label file, so rare classes are represented in every split. Pass a seed for a
+    deterministic split. Assignments are saved to output_dir/split_assignments.tsv; rerunning with
+    the same seed and ratios on an updated dataset keeps every existing image in its split, only
+    places new files, and removes files whose source image is gone. Pass groups ({stem: group id},
+    e.g. deduplicate(...)['group_of']) to keep near-duplicate images together in one split.
+
+    mode selects how files are materialized in output_dir: 'copy', 'hardlink', 'symlink',
+    'reflink', or 'manifest'. 'manifest' touches no pixels and only writes train.txt, val.txt
+    and test.txt image lists into output_dir; Ultralytics accepts these in a data YAML and finds
+    labels by swapping '/images/' for '/labels/' in each path, so images_dir and annotations_dir
+    should follow that layout. File operations run on a pool of `workers` threads.
+    Pass a prebuilt DatasetIndex to skip rescanning images_dir and annotations_dir.
+
+    Returns a dict mapping each split name to its files, placed, removed, bytes, seconds,
+    files_per_s, mb_per_s and classes (images per class ID).
     """
-    assert train_ratio + val_ratio + test_ratio == 1.0, "Split ratios must sum to 1.0"
+    assert math.isclose(train_ratio + val_ratio + test_ratio, 1.0), "Split ratios must sum to 1.0"
+    if mode not in SPLIT_MODES:
+        raise ValueError(f"mode must be one of {SPLIT_MODES}, got {mode!r}")
+    if seed is None:
+        seed = random.randrange(2 ** 32)
 
     split_dirs = {
         'train': os.path.join(output_dir, 'train'),
         'val': os.path.join(output_dir, 'val'),
         'test': os.path.join(output_dir, 'test')
     }
-    for split in split_dirs.values():
-        ensure_dir(os.path.join(split, 'images'))
-        ensure_dir(os.path.join(split, 'labels'))
+    if mode == 'manifest':
+        ensure_dir(output_dir)
+    else:
+        for split in split_dirs.values():
+            ensure_dir(os.path.join(split, 'images'))
+            ensure_dir(os.path.join(split, 'labels'))
 
-    all_images = [f for f in os.listdir(images_dir) if f.lower().endswith('.jpg')]
-    random.shuffle(all_images)
+    if index is None:
+        index = DatasetIndex(images_dir, annotations_dir)
+    entries = {entry.stem: entry for entry in index.images()}
 
-    num_train = int(len(all_images) * train_ratio)
-    num_val = int(len(all_images) * val_ratio)
+    ratios = {'train': train_ratio, 'val': val_ratio, 'test': test_ratio}
+    settings = {'seed': str(seed), 'ratios': f"{train_ratio},{val_ratio},{test_ratio}",
+                'stratify': str(bool(stratify)), 'mode': mode}
+    assignments_path = os.path.join(output_dir, 'split_assignments.tsv')
+    previous_settings, previous = _load_split_assignments(assignments_path)
+    same_split = all(previous_settings.get(key) == settings[key] for key in ('seed', 'ratios', 'stratify'))
+    same_files = previous_settings.get('mode') == mode
 
-    splits = {
-        'train': all_images[:num_train],
-        'val': all_images[num_train:num_train + num_val],
-        'test': all_images[num_train + num_val:]
-    }
+    if stratify:
+        image_classes = {}
+        for entry in entries.values():
+            image_classes[entry.stem] = read_label_classes(entry.label_path) if entry.has_label and entry.label_size else frozenset()
+    else:
+        image_classes = {stem: frozenset() for stem in entries}
+    fixed = {stem: row[0] for stem, row in previous.items()} if same_split else None
+    assigned = assign_splits(image_classes, ratios, seed, fixed=fixed, groups=groups)
+
+    splits = {name: sorted((stem for stem, split in assigned.items() if split == name),
+                           key=lambda stem: _split_order_key(seed, stem)) for name in split_dirs}
+
+    def place_pair(job):
+        split_name, stem = job
+        entry = entries[stem]
+        jobs = [(entry.image_path, os.path.join(split_dirs[split_name], 'images', os.path.basename(entry.image_path)))]
+        if entry.has_label:
+            jobs.append((entry.label_path, os.path.join(split_dirs[split_name], 'labels', os.path.basename(entry.label_path))))
+        nbytes, placed = 0, False
+        for src, dst in jobs:
+            if same_files and stem in previous and previous[stem][0] == split_name and _is_current(src, dst, mode):
+                continue
+            nbytes += materialize_file(src, dst, mode)
+            placed = True
+        return nbytes, placed
+
+    def remove_stale(split_name, keep_assigned=True):
+        # Files from the previous run whose image now lives in another split or no longer exists
+        # (all of them with keep_assigned=False, when this run only writes manifests)
+        removed = 0
+        for stem, (split, image, label) in previous.items():
+            if split != split_name or (keep_assigned and assigned.get(stem) == split_name):
+                continue
+            paths = [os.path.join(split_dirs[split], 'images', image)]
+            if label:
+                paths.append(os.path.join(split_dirs[split], 'labels', label))
+            for path in paths:
+                if os.path.lexists(path):
+                    os.remove(path)
+            removed += 1
+        return removed
+
+    report = {}
+    for split_name, stems in splits.items():
+        start = time.perf_counter()
+        placed = removed = 0
+        if mode == 'manifest':
+            # Files placed by an earlier copy/link run would otherwise linger next to the manifests
+            if previous_settings.get('mode', 'manifest') != 'manifest':
+                removed = remove_stale(split_name, keep_assigned=False)
+            with open(os.path.join(output_dir, f"{split_name}.txt"), 'w') as manifest:
+                manifest.writelines(os.path.abspath(entries[stem].image_path) + "\n" for stem in stems)
+            nbytes = 0
+        else:
+            removed = remove_stale(split_name)
+            nbytes = 0
+            for pair_bytes, pair_placed in run_bounded(place_pair, ((split_name, stem) for stem in stems), workers):
+                nbytes += pair_bytes
+                placed += pair_placed
+        seconds = time.perf_counter() - start
+        report[split_name] = {
+            'files': len(stems),
+            'placed': placed,
+            'removed': removed,
+            'bytes': nbytes,
+            'seconds': seconds,
+            'files_per_s': len(stems) / max(seconds, 1e-9),
+            'mb_per_s': nbytes / max(seconds, 1e-9) / 1e6,
+            'classes': dict(sorted(Counter(c for stem in stems for c in image_classes[stem]).items())),
+        }
+        if mode == 'manifest':
+            print(f"Listed {len(stems)} images in {split_name} split, removed {removed} previously placed")
+        else:
+            print(f"Placed ({mode}) {placed} of {len(stems)} images in {split_name} split, removed {removed}: "
+                  f"{format_throughput(placed, nbytes, seconds)}")
+
+    with open(assignments_path + '.tmp', 'w') as file:
+        file.writelines(f"# {key}={value}\n" for key, value in settings.items())
+        for split_name, stems in splits.items():
+            for stem in stems:
+                entry = entries[stem]
+                label = os.path.basename(entry.label_path) if entry.has_label else ''
+                file.write(f"{split_name}\t{stem}\t{os.path.basename(entry.image_path)}\t{label}\n")
+    os.replace(assignments_path + '.tmp', assignments_path)
 
-    for split_name, images in splits.items():
-        for image in images:
-            shutil.copy(os.path.join(images_dir, image), os.path.join(split_dirs[split_name], 'images', image))
-            label = os.path.splitext(image)[0] + '.txt'
-            shutil.copy(os.path.join(annotations_dir, label), os.path.join(split_dirs[split_name], 'labels', label))
-        print(f"Copied {len(images)} images to {split_name} directory.")
+    missing = {c for c in set().union(*image_classes.values()) for name in splits
+               if ratios[name] > 0 and c not in report[name]['classes']}
+    if missing:
+        print(f"Classes with too few images to appear in every split: {sorted(missing)}")
+    return report
@@ -0,0 +1,164 @@
+# dataset_index.py
+
+import os
+import sys
+import hashlib
+
+DEFAULT_IMAGE_FORMATS = ['.jpg', '.jpeg', '.png']
+
+def user_cache_path(folder, name):
+    """
+    Path for a cache file or folder `name` that belongs to dataset `folder`, kept in the user's
+    cache directory (XDG_CACHE_HOME or ~/.cache, LOCALAPPDATA on Windows) instead of the dataset,
+    which may be read-only or shared. The parent folder is not created here.
+    """
+    if sys.platform == 'win32':
+        root = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    key = hashlib.blake2b(os.path.abspath(folder).encode(), digest_size=8).hexdigest()
+    return os.path.join(root, 'noaa_ai_tools', f"{os.path.basename(os.path.normpath(folder))}-{key}", name)
+
+class IndexEntry:
+    """
+    Image and label paths, sizes and mtimes for one file stem.
+    """
+    __slots__ = ('stem', 'image_path', 'image_size', 'image_mtime', 'label_path', 'label_size', 'label_mtime')
+
+    def __init__(self, stem):
+        self.stem = stem
+        self.image_path = None
+        self.image_size = 0
+        self.image_mtime = 0.0
+        self.label_path = None
+        self.label_size = 0
+        self.label_mtime = 0.0
+
+    @property
+    def has_image(self):
+        return self.image_path is not None
+
+    @property
+    def has_label(self):
+        return self.label_path is not None
+
+    def __repr__(self):
+        return f"IndexEntry({self.stem!r}, image={self.image_path!r}, label={self.label_path!r})"
+
+class DatasetIndex:
+    """
+    Map file stems to their image and label files using a single os.scandir pass per folder.
+
+    Build one index and pass it to the dataprep functions (index=...) so slow network shares
+    are walked once instead of being probed with one os.path.exists call per label and extension.
+    """
+    def __init__(self, image_folder=None, label_folder=None, image_formats=None):
+        self.image_folder = image_folder
+        self.label_folder = label_folder
+        self.image_formats = [ext.lower() for ext in (image_formats or DEFAULT_IMAGE_FORMATS)]
+        self.entries = {}
+        self.refresh()
+
+    @classmethod
+    def from_dataset(cls, dataset_folder, image_formats=None):
+        """
+        Build an index for a folder laid out as dataset_folder/images + dataset_folder/labels.
+        """
+        return cls(os.path.join(dataset_folder, 'images'), os.path.join(dataset_folder, 'labels'), image_formats)
+
+    def refresh(self):
+        """
+        Rescan the image and label folders, replacing the current entries.
+        """
+        self.entries = {}
+        if self.image_folder and self.label_folder and os.path.normpath(self.image_folder) == os.path.normpath(self.label_folder):
+            self._scan(self.image_folder, images=True, labels=True)
+        else:
+            if self.image_folder:
+                self._scan(self.image_folder, images=True, labels=False)
+            if self.label_folder:
+                self._scan(self.label_folder, images=False, labels=True)
+        return self
+
+    def _scan(self, folder, images, labels):
+        # Earlier extensions in image_formats win when a stem has several images
+        priority = {ext: rank for rank, ext in enumerate(self.image_formats)}
+        chosen_rank = {}
+        with os.scandir(folder) as it:
+            for dir_entry in it:
+                if not dir_entry.is_file():
+                    continue
+                stem, ext = os.path.splitext(dir_entry.name)
+                ext = ext.lower()
+                if labels and ext == '.txt':
+                    st = dir_entry.stat()
+                    entry = self.entries.get(stem) or self.entries.setdefault(stem, IndexEntry(stem))
+                    entry.label_path = dir_entry.path
+                    entry.label_size = st.st_size
+                    entry.label_mtime = st.st_mtime
+                elif images and ext in priority:
+                    if priority[ext] >= chosen_rank.get(stem, len(priority)):
+                        continue
+                    chosen_rank[stem] = priority[ext]
+                    st = dir_entry.stat()
+                    entry = self.entries.get(stem) or self.entries.setdefault(stem, IndexEntry(stem))
+                    entry.image_path = dir_entry.path
+                    entry.image_size = st.st_size
+                    entry.image_mtime = st.st_mtime
+
+    def without(self, stems):
+        """
+        Return a copy of this index with the given stems removed, without rescanning.
+        """
+        stems = set(stems)
+        subset = object.__new__(DatasetIndex)
+        subset.image_folder = self.image_folder
+        subset.label_folder = self.label_folder
+        subset.image_formats = list(self.image_formats)
+        subset.entries = {stem: entry for stem, entry in self.entries.items() if stem not in stems}
+        return subset
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __contains__(self, stem):
+        return stem in self.entries
+
+    def __getitem__(self, stem):
+        return self.entries[stem]
+
+    def get(self, stem, default=None):
+        return self.entries.get(stem, default)
+
+    def images(self):
+        """
+        Entries that have an image, in sorted stem order.
+        """
+        return [self.entries[stem] for stem in sorted(self.entries) if self.entries[stem].has_image]
+
+    def labels(self):
+        """
+        Entries that have a label file, in sorted stem order.
+        """
+        return [self.entries[stem] for stem in sorted(self.entries) if self.entries[stem].has_label]
+
+    def labeled(self):
+        """
+        Entries that have both an image and a label file.
+        """
+        return [entry for entry in self.images() if entry.has_label]
+
+    def unlabeled_images(self):
+        """
+        Entries that have an image but no label file.
+        """
+        return [entry for entry in self.images() if not entry.has_label]
+
+    def orphan_labels(self):
+        """
+        Entries that have a label file but no image.
+        """
+        return [entry for entry in self.labels() if not entry.has_image]
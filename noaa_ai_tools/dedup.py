@@ -0,0 +1,257 @@
+# dedup.py
+
+import io
+import os
+import time
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .dataset_index import DatasetIndex, user_cache_path
+
+HASH_CACHE_NAME = '.image_hashes.tsv'
+
+def _popcount(value):
+    return bin(value).count('1')
+
+def hamming_distance(hash_a, hash_b):
+    """
+    Number of differing bits between two perceptual hashes.
+    """
+    return _popcount(hash_a ^ hash_b)
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash of a PIL image: hash_size * hash_size bits, robust to re-encoding and small changes.
+    """
+    image = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hash_image_file(path):
+    """
+    Return (content hash hex, perceptual hash) for one image. The file is read once; JPEGs are
+    decoded at reduced resolution through libjpeg's DCT scaling since the hash only needs 9x8 pixels.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    content = hashlib.blake2b(data, digest_size=16).hexdigest()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft('L', (64, 64))
+            perceptual = dhash(image)
+    except (OSError, Image.DecompressionBombError, SyntaxError):
+        # Unreadable, truncated or oversized image: keep the content hash, skip near-duplicate matching
+        perceptual = None
+    return content, perceptual
+
+def _hash_chunk(paths):
+    return [hash_image_file(path) for path in paths]
+
+def _load_hash_cache(cache_path):
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r') as file:
+            for line in file:
+                path, size, mtime, content, perceptual = line.rstrip("\n").split("\t")
+                cache[path] = (int(size), float(mtime), content, int(perceptual) if perceptual else None)
+    return cache
+
+def _save_hash_cache(cache_path, cache):
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    with open(cache_path + '.tmp', 'w') as file:
+        for path, (size, mtime, content, perceptual) in cache.items():
+            file.write(f"{path}\t{size}\t{mtime!r}\t{content}\t{'' if perceptual is None else perceptual}\n")
+    os.replace(cache_path + '.tmp', cache_path)
+
+def compute_image_hashes(index, workers=None, chunk_size=256, cache_path=None):
+    """
+    Compute content and perceptual hashes for every image in a DatasetIndex on a process pool.
+
+    Results are cached in cache_path (default: .image_hashes.tsv in the user cache directory, see
+    user_cache_path) keyed by (path, size, mtime), so reruns only hash new or modified images. Pass
+    cache_path=False to disable the cache. A cache that cannot be written is reported, not raised.
+    Returns {stem: (content hash hex, perceptual hash or None)}.
+    """
+    if cache_path is None and index.image_folder:
+        cache_path = user_cache_path(index.image_folder, HASH_CACHE_NAME)
+    cache = _load_hash_cache(cache_path) if cache_path else {}
+
+    hashes, todo = {}, []
+    for entry in index.images():
+        cached = cache.get(entry.image_path)
+        if cached and cached[0] == entry.image_size and cached[1] == entry.image_mtime:
+            hashes[entry.stem] = cached[2:]
+        else:
+            todo.append(entry)
+
+    start = time.perf_counter()
+    chunks = [[entry.image_path for entry in todo[i:i + chunk_size]] for i in range(0, len(todo), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        results = [_hash_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            results = list(executor.map(_hash_chunk, chunks))
+    for entry, result in zip(todo, (result for chunk in results for result in chunk)):
+        hashes[entry.stem] = result
+        cache[entry.image_path] = (entry.image_size, entry.image_mtime) + result
+    seconds = time.perf_counter() - start
+
+    if cache_path and todo:
+        try:
+            _save_hash_cache(cache_path, cache)
+        except OSError as e:
+            print(f"Could not write hash cache {cache_path}: {e}")
+    print(f"Hashed {len(todo)} images ({len(hashes) - len(todo)} cached) in {seconds:.1f}s")
+    return hashes
+
+class BKTree:
+    """
+    Burkhard-Keller tree over perceptual hashes for Hamming-distance range queries.
+    """
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = self.root
+        if node is None:
+            self.root = [value, [item], {}]
+            return
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def query(self, value, max_distance):
+        """
+        Return the items of every stored hash within max_distance bits of value.
+        """
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                found.extend(items)
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+def find_duplicate_groups(hashes, max_distance=4):
+    """
+    Group stems whose images are byte-identical or whose perceptual hashes differ by at most
+    max_distance bits (0 disables near-duplicate matching). Returns a list of groups
+    (sorted lists of stems), each with at least two members.
+    """
+    parent = {stem: stem for stem in hashes}
+
+    def find(stem):
+        while parent[stem] != stem:
+            parent[stem] = parent[parent[stem]]
+            stem = parent[stem]
+        return stem
+
+    def union(a, b):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    by_content = defaultdict(list)
+    for stem, (content, _) in hashes.items():
+        by_content[content].append(stem)
+    for stems in by_content.values():
+        for stem in stems[1:]:
+            union(stems[0], stem)
+
+    if max_distance > 0:
+        tree = BKTree()
+        for stem in sorted(hashes):
+            perceptual = hashes[stem][1]
+            if perceptual is None:
+                continue
+            for match in tree.query(perceptual, max_distance):
+                union(match, stem)
+            tree.add(perceptual, stem)
+
+    groups = defaultdict(list)
+    for stem in hashes:
+        groups[find(stem)].append(stem)
+    return sorted((sorted(stems) for stems in groups.values() if len(stems) > 1), key=lambda stems: stems[0])
+
+def find_duplicate_clusters(hashes, max_distance=4, key=None):
+    """
+    Greedy leader clustering for dropping duplicates. Stems are visited in key order (default: by
+    stem); each one joins the closest kept leader that is byte-identical or within max_distance
+    bits, otherwise it is kept as a new leader. Unlike find_duplicate_groups, matches do not chain:
+    every dropped image is a near-duplicate of the image kept in its place, so a slow pan keeps a
+    frame every max_distance bits. Returns {leader: sorted list of its duplicates}.
+    """
+    leader_of_content = {}
+    tree = BKTree()
+    clusters = {}
+    for stem in sorted(hashes, key=key):
+        content, perceptual = hashes[stem]
+        leader = leader_of_content.get(content)
+        if leader is None and max_distance > 0 and perceptual is not None:
+            matches = tree.query(perceptual, max_distance)
+            if matches:
+                leader = min(matches, key=lambda match: (hamming_distance(perceptual, hashes[match][1]), match))
+        if leader is None:
+            leader_of_content[content] = stem
+            if perceptual is not None:
+                tree.add(perceptual, stem)
+            clusters[stem] = []
+        else:
+            clusters[leader].append(stem)
+    return {leader: sorted(stems) for leader, stems in clusters.items() if stems}
+
+def deduplicate(image_folder=None, label_folder=None, action='group', max_distance=4, workers=None,
+                cache_path=None, index=None):
+    """
+    Find exact and near-duplicate images and either group or drop them.
+
+    action='group' keeps every image and returns group_of ({stem: group id}) for
+    split_dataset(groups=...), so each duplicate group lands in a single split.
+    action='drop' keeps labeled images with the most label data first and drops every image within
+    max_distance of a kept one (see find_duplicate_clusters), returning an index without them;
+    groups are then the kept image with its dropped duplicates. No files are deleted in either mode.
+
+    Returns a dict with groups, group_of, dropped (list of stems) and index (a DatasetIndex).
+    """
+    if action not in ('group', 'drop'):
+        raise ValueError(f"action must be 'group' or 'drop', got {action!r}")
+    if index is None:
+        index = DatasetIndex(image_folder, label_folder)
+
+    hashes = compute_image_hashes(index, workers=workers, cache_path=cache_path)
+    dropped = []
+    if action == 'drop':
+        clusters = find_duplicate_clusters(hashes, max_distance,
+                                           key=lambda stem: (not index[stem].has_label, -index[stem].label_size, stem))
+        groups = sorted((sorted([leader] + stems) for leader, stems in clusters.items()), key=lambda stems: stems[0])
+        dropped = sorted(stem for stems in clusters.values() for stem in stems)
+    else:
+        groups = find_duplicate_groups(hashes, max_distance)
+    group_of = {stem: group_id for group_id, stems in enumerate(groups) for stem in stems}
+
+    duplicates = sum(len(stems) - 1 for stems in groups)
+    print(f"Found {len(groups)} duplicate groups in {len(hashes)} images "
+          f"({duplicates} redundant images, {100.0 * duplicates / max(len(hashes), 1):.1f}%)")
+    return {
+        'groups': groups,
+        'group_of': group_of,
+        'dropped': dropped,
+        'index': index.without(dropped) if dropped else index,
+    }
@@ -0,0 +1,155 @@
+# label_store.py
+
+import os
+import time
+import shutil
+
+import numpy as np
+
+from .dataset_index import DatasetIndex
+from .dataprep import ensure_dir
+from .stats import parse_label_boxes
+
+STORE_DIR_NAME = '.label_store'
+CURRENT_NAME = 'CURRENT'
+
+class LabelStore:
+    """
+    Compiled, memory-mapped copy of a folder of YOLO label files.
+
+    All boxes live in one float32 (n, 5) array (boxes.npy) and image i owns rows
+    offsets[i]:offsets[i + 1] (offsets.npy, int64). A stem -> index table gives O(1) lookup of an
+    image's boxes without parsing text. refresh() recompiles only label files whose size or mtime
+    changed and copies the rest over as array slices.
+
+    Each refresh writes a new generation folder (gen-<ns>) and then atomically replaces the
+    CURRENT file naming it, so an interrupted refresh leaves the previous generation in use.
+    """
+    def __init__(self, label_folder, store_dir=None):
+        self.label_folder = label_folder
+        self.store_dir = store_dir or os.path.join(label_folder, STORE_DIR_NAME)
+        self.generation = None
+        self._empty()
+        self.open()
+
+    def _empty(self):
+        self.stems = []
+        self.row_of = {}
+        self.boxes_array = np.zeros((0, 5), dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.label_mtime = np.zeros(0, dtype=np.float64)
+        self.label_size = np.zeros(0, dtype=np.int64)
+
+    def _path(self, *names):
+        return os.path.join(self.store_dir, *names)
+
+    def open(self):
+        """
+        Memory-map the current generation of the store. Returns True when a complete, consistent
+        one was found; otherwise the store is left empty so the next refresh() rebuilds it.
+        """
+        try:
+            with open(self._path(CURRENT_NAME), 'r') as file:
+                generation = file.read().strip()
+            boxes_array = np.load(self._path(generation, 'boxes.npy'), mmap_mode='r')
+            offsets = np.load(self._path(generation, 'offsets.npy'), mmap_mode='r')
+            label_mtime = np.load(self._path(generation, 'label_mtime.npy'))
+            label_size = np.load(self._path(generation, 'label_size.npy'))
+            with open(self._path(generation, 'stems.txt'), 'r') as file:
+                stems = [line.rstrip("\n") for line in file]
+        except (OSError, ValueError):
+            self._empty()
+            return False
+        if (len(offsets) != len(stems) + 1 or offsets[-1] != len(boxes_array)
+                or len(label_mtime) != len(stems) or len(label_size) != len(stems)):
+            print(f"Label store {self.store_dir} is inconsistent; it will be rebuilt")
+            self._empty()
+            return False
+        self.generation = generation
+        self.boxes_array, self.offsets, self.label_mtime, self.label_size = boxes_array, offsets, label_mtime, label_size
+        self.stems = stems
+        self.row_of = {stem: i for i, stem in enumerate(stems)}
+        return True
+
+    def refresh(self, index=None):
+        """
+        Recompile changed label files and rewrite the store. Returns the number of reparsed files.
+        """
+        start = time.perf_counter()
+        if index is None:
+            index = DatasetIndex(label_folder=self.label_folder)
+        entries = index.labels()
+
+        pieces, offsets, changed = [], [0], 0
+        for entry in entries:
+            old = self.row_of.get(entry.stem)
+            if old is not None and self.label_mtime[old] == entry.label_mtime and self.label_size[old] == entry.label_size:
+                # A copy, not a view: views would keep the old generation mapped after it is removed
+                boxes = np.array(self.boxes_array[self.offsets[old]:self.offsets[old + 1]])
+            else:
+                boxes = parse_label_boxes(entry.label_path)
+                changed += 1
+            pieces.append(boxes)
+            offsets.append(offsets[-1] + len(boxes))
+
+        if not changed and len(entries) == len(self.stems):
+            return 0
+
+        boxes_array = np.concatenate(pieces).astype(np.float32) if pieces else np.zeros((0, 5), dtype=np.float32)
+        del pieces
+        generation = f"gen-{time.time_ns()}"
+        ensure_dir(self._path(generation))
+        arrays = {
+            'boxes.npy': boxes_array,
+            'offsets.npy': np.asarray(offsets, dtype=np.int64),
+            'label_mtime.npy': np.array([entry.label_mtime for entry in entries], dtype=np.float64),
+            'label_size.npy': np.array([entry.label_size for entry in entries], dtype=np.int64),
+        }
+        try:
+            for name, array in arrays.items():
+                with open(self._path(generation, name), 'wb') as file:
+                    np.save(file, array)
+            with open(self._path(generation, 'stems.txt'), 'w') as file:
+                file.writelines(entry.stem + "\n" for entry in entries)
+            # The switch to the new generation is this single rename
+            with open(self._path(CURRENT_NAME + '.tmp'), 'w') as file:
+                file.write(generation + "\n")
+            os.replace(self._path(CURRENT_NAME + '.tmp'), self._path(CURRENT_NAME))
+        except BaseException:
+            shutil.rmtree(self._path(generation), ignore_errors=True)
+            raise
+        finally:
+            # Map the current generation, the new one or the old one if writing failed
+            self.open()
+        self._remove_old_generations()
+        print(f"Label store refreshed: {changed} of {len(entries)} label files compiled in {time.perf_counter() - start:.2f}s")
+        return changed
+
+    def _remove_old_generations(self):
+        # A generation still mapped elsewhere (Windows) fails to delete; it is retried next refresh
+        if self.generation is None:
+            return
+        for name in os.listdir(self.store_dir):
+            if name.startswith('gen-') and name != self.generation:
+                shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def __len__(self):
+        return len(self.stems)
+
+    def __contains__(self, stem):
+        return stem in self.row_of
+
+    def boxes(self, stem):
+        """
+        (n, 5) float32 view of class, x, y, w, h for one image; empty if the stem has no label.
+        """
+        i = self.row_of.get(stem)
+        if i is None:
+            return self.boxes_array[:0]
+        return self.boxes_array[self.offsets[i]:self.offsets[i + 1]]
+
+    def box_owner(self):
+        """
+        Image index of every box row, for vectorized whole-dataset analytics.
+        """
+        return np.repeat(np.arange(len(self.stems)), np.diff(self.offsets))
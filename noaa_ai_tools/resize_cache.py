@@ -0,0 +1,196 @@
+# resize_cache.py
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+from PIL import Image, ImageOps
+
+from .dataprep import ensure_dir, materialize_file
+
+MANIFEST_NAME = 'resize_manifest.tsv'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+def letterbox_size(width, height, imgsz):
+    """
+    Size Ultralytics resizes an image to before letterboxing: long side = imgsz, aspect kept.
+    Images already smaller than imgsz are left as-is, so nothing is upscaled.
+    """
+    ratio = imgsz / max(width, height)
+    if ratio >= 1:
+        return width, height
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+def resize_image_file(src, dst, imgsz, quality=90):
+    """
+    Write src to dst with its long side resized to imgsz. JPEGs are decoded at reduced resolution
+    when possible. The output format follows dst's extension (.jpg or .webp). Returns
+    (original width, original height, new width, new height).
+    """
+    with Image.open(src) as image:
+        width, height = image.size
+        rotated = image.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+        if rotated:
+            width, height = height, width
+        target = letterbox_size(width, height, imgsz)
+        if target != (width, height):
+            # draft() works in stored orientation, before the EXIF rotation is applied
+            image.draft('RGB', target[::-1] if rotated else target)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        if image.size != target:
+            image = image.resize(target, Image.LANCZOS)
+        options = {'quality': quality}
+        if dst.lower().endswith('.webp'):
+            options['method'] = 4
+        image.save(dst, **options)
+    return width, height, target[0], target[1]
+
+def _resize_chunk(jobs):
+    results = []
+    for src, dst, imgsz, quality in jobs:
+        try:
+            results.append(resize_image_file(src, dst, imgsz, quality))
+        except (OSError, Image.DecompressionBombError, SyntaxError) as e:
+            # One unreadable, truncated or oversized image fails alone, not the whole chunk
+            results.append(e)
+    return results
+
+def _label_path_for(image_path):
+    # Same convention as Ultralytics: .../images/x.jpg -> .../labels/x.txt
+    head, _, tail = image_path.rpartition(os.sep + 'images' + os.sep)
+    return os.path.join(head, 'labels', os.path.splitext(tail)[0] + '.txt') if head else None
+
+def _split_images(base_path, source):
+    """
+    Resolve a data YAML split entry (folder, .txt list or list of either) into image paths.
+    """
+    sources = source if isinstance(source, (list, tuple)) else [source]
+    images = []
+    for item in sources:
+        item = item if os.path.isabs(item) else os.path.join(base_path, item)
+        if os.path.isdir(item):
+            images.extend(os.path.join(item, name) for name in sorted(os.listdir(item))
+                          if name.lower().endswith(IMAGE_EXTENSIONS))
+        elif item.endswith('.txt'):
+            folder = os.path.dirname(item)
+            with open(item, 'r') as file:
+                for line in file:
+                    line = line.strip()
+                    if line:
+                        images.append(line if os.path.isabs(line) else os.path.normpath(os.path.join(folder, line)))
+    return images
+
+def _load_manifest(path):
+    manifest = {}
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            next(file, None)
+            for line in file:
+                src, dst, size, mtime, w0, h0, w1, h1 = line.rstrip("\n").split("\t")
+                manifest[dst] = (src, int(size), float(mtime), int(w0), int(h0), int(w1), int(h1))
+    return manifest
+
+def build_resized_cache(data_yaml, output_dir, imgsz=640, image_format='jpg', quality=90, workers=None, chunk_size=64,
+                        label_mode='copy'):
+    """
+    Build a pre-resized copy of a YOLO dataset so training no longer decodes and shrinks
+    full-resolution images every epoch.
+
+    Every image of the train/val/test splits in data_yaml is written to output_dir/<split>/images
+    with its long side resized to imgsz (aspect ratio kept, never upscaled), which is exactly what
+    Ultralytics does before letterboxing, so normalized YOLO labels stay valid and are placed
+    unchanged into output_dir/<split>/labels with label_mode (see dataprep.materialize_file). The
+    default 'copy' snapshots them; with 'hardlink' or 'symlink', later in-place edits of the source
+    labels also change the cache, which the manifest does not record. image_format is 'jpg' or 'webp', written
+    at the given quality. Work runs on a pool of `workers` processes and is incremental: images
+    whose source size and mtime match resize_manifest.tsv are skipped. The manifest records the
+    source path, original and cached size of every image.
+
+    Returns the path of the new data YAML (output_dir/data.yaml), to pass to training with the same imgsz.
+    """
+    with open(data_yaml, 'r') as file:
+        config = yaml.safe_load(file)
+    base_path = config.get('path') or os.path.dirname(os.path.abspath(data_yaml))
+    if not os.path.isabs(base_path):
+        base_path = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(data_yaml)), base_path))
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = _load_manifest(manifest_path)
+    jobs, labels, new_config = [], [], dict(config)
+    up_to_date = 0
+    new_config['path'] = os.path.abspath(output_dir)
+    for split in ('train', 'val', 'test'):
+        if not config.get(split):
+            continue
+        image_dir = os.path.join(output_dir, split, 'images')
+        label_dir = os.path.join(output_dir, split, 'labels')
+        ensure_dir(image_dir)
+        ensure_dir(label_dir)
+        new_config[split] = f"{split}/images"
+        for src in _split_images(base_path, config[split]):
+            stem = os.path.splitext(os.path.basename(src))[0]
+            dst = os.path.join(image_dir, f"{stem}.{image_format}")
+            st = os.stat(src)
+            cached = manifest.get(dst)
+            if not (cached and cached[0] == src and cached[1] == st.st_size and cached[2] == st.st_mtime and os.path.exists(dst)):
+                jobs.append((src, dst, st.st_size, st.st_mtime))
+            else:
+                up_to_date += 1
+            label = _label_path_for(src)
+            if label and os.path.exists(label):
+                labels.append((label, os.path.join(label_dir, stem + '.txt')))
+
+    start = time.perf_counter()
+    chunks = [[(src, dst, imgsz, quality) for src, dst, _, _ in jobs[i:i + chunk_size]] for i in range(0, len(jobs), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        results = [_resize_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            results = list(executor.map(_resize_chunk, chunks))
+    failed = 0
+    for (src, dst, size, mtime), result in zip(jobs, (result for chunk in results for result in chunk)):
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"Failed to resize {src}: {result}")
+            continue
+        manifest[dst] = (src, size, mtime) + tuple(result)
+    seconds = time.perf_counter() - start
+
+    for src, dst in labels:
+        materialize_file(src, dst, label_mode)
+
+    with open(manifest_path + '.tmp', 'w') as file:
+        file.write("source\tcached\tsource_bytes\tsource_mtime\twidth\theight\tcached_width\tcached_height\n")
+        for dst, (src, size, mtime, w0, h0, w1, h1) in sorted(manifest.items()):
+            file.write(f"{src}\t{dst}\t{size}\t{mtime!r}\t{w0}\t{h0}\t{w1}\t{h1}\n")
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    out_yaml = os.path.join(output_dir, 'data.yaml')
+    with open(out_yaml, 'w') as file:
+        yaml.safe_dump(new_config, file, sort_keys=False)
+    print(f"Resized {len(jobs) - failed} images to imgsz={imgsz} ({up_to_date} up to date, "
+          f"{failed} failed) in {seconds:.1f}s ({(len(jobs) - failed) / max(seconds, 1e-9):.1f} images/s)")
+    print(f"Train with data={out_yaml} imgsz={imgsz}")
+    return out_yaml
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a pre-resized cache of a YOLO dataset for faster training.")
+    parser.add_argument('data', help="Dataset YAML")
+    parser.add_argument('output', help="Output folder for the resized dataset")
+    parser.add_argument('--imgsz', type=int, default=640, help="Training image size (long side)")
+    parser.add_argument('--format', choices=['jpg', 'webp'], default='jpg', help="Output image format")
+    parser.add_argument('--quality', type=int, default=90, help="JPEG/WebP quality")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all CPUs)")
+    parser.add_argument('--label-mode', choices=['copy', 'hardlink', 'symlink'], default='copy',
+                        help="How labels are placed; links follow later edits of the source labels")
+    args = parser.parse_args(argv)
+    build_resized_cache(args.data, args.output, args.imgsz, args.format, args.quality, args.workers, label_mode=args.label_mode)
+
+if __name__ == '__main__':
+    sys.exit(main())
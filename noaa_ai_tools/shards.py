@@ -0,0 +1,203 @@
+# shards.py
+
+import io
+import os
+import sys
+import mmap
+import time
+import random
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from .dataset_index import DatasetIndex
+from .dataprep import ensure_dir, run_bounded_ordered, format_throughput
+from .stats import parse_label_boxes
+
+SHARD_INDEX_DTYPE = np.dtype([
+    ('shard', '<i4'),        # Shard file number
+    ('offset', '<i8'),       # Byte offset of the image inside the shard
+    ('length', '<i8'),       # Image size in bytes
+    ('label_start', '<i8'),  # First row of this image's boxes in the labels array
+    ('label_count', '<i8'),  # Number of boxes
+])
+
+def _shard_paths(folder, name):
+    return {
+        'index': os.path.join(folder, f"{name}.index.npy"),
+        'labels': os.path.join(folder, f"{name}.labels.npy"),
+        'names': os.path.join(folder, f"{name}.names.txt"),
+        'shard': os.path.join(folder, f"{name}-{{:05d}}.bin"),
+    }
+
+def pack_split(image_dir, label_dir, output_dir, name='train', shard_bytes=1 << 30, workers=8, index=None):
+    """
+    Pack a folder of images + YOLO labels into a few large shard files.
+
+    Image bytes are appended unchanged to <name>-00000.bin, <name>-00001.bin, ... (a new shard starts
+    once shard_bytes is reached). A fixed-width record index (<name>.index.npy) holds each image's
+    shard, offset and length, and all boxes are stored as one contiguous float32 (n, 5) array
+    (<name>.labels.npy) so both can be memory-mapped. Source files are read on a pool of `workers`
+    threads; record i is always index.images()[i], so packing the same input gives the same layout.
+    Returns the number of packed images.
+    """
+    if index is None:
+        index = DatasetIndex(image_dir, label_dir)
+    ensure_dir(output_dir)
+    paths = _shard_paths(output_dir, name)
+    entries = index.images()
+
+    def read_pair(entry):
+        with open(entry.image_path, 'rb') as file:
+            data = file.read()
+        boxes = parse_label_boxes(entry.label_path) if entry.has_label else np.zeros((0, 5), dtype=np.float32)
+        return entry.stem + os.path.splitext(entry.image_path)[1], data, boxes
+
+    records = np.zeros(len(entries), dtype=SHARD_INDEX_DTYPE)
+    names, label_chunks = [], []
+    shard, shard_file, offset, label_rows, nbytes = 0, None, 0, 0, 0
+    start = time.perf_counter()
+    try:
+        shard_file = open(paths['shard'].format(shard), 'wb')
+        for i, (file_name, data, boxes) in enumerate(run_bounded_ordered(read_pair, entries, workers)):
+            if offset and offset + len(data) > shard_bytes:
+                shard_file.close()
+                shard += 1
+                shard_file = open(paths['shard'].format(shard), 'wb')
+                offset = 0
+            shard_file.write(data)
+            records[i] = (shard, offset, len(data), label_rows, len(boxes))
+            offset += len(data)
+            nbytes += len(data)
+            label_rows += len(boxes)
+            label_chunks.append(boxes)
+            names.append(file_name)
+    finally:
+        if shard_file:
+            shard_file.close()
+
+    labels = np.concatenate(label_chunks) if label_chunks else np.zeros((0, 5), dtype=np.float32)
+    np.save(paths['labels'], labels.astype(np.float32))
+    np.save(paths['index'], records)
+    with open(paths['names'], 'w') as file:
+        file.writelines(file_name + "\n" for file_name in names)
+    seconds = time.perf_counter() - start
+    print(f"Packed {len(entries)} images into {shard + 1} shards ({nbytes / 1e6:.1f} MB, {len(labels)} boxes): "
+          f"{format_throughput(len(entries), nbytes, seconds)}")
+    return len(entries)
+
+class ShardReader:
+    """
+    Random access by index into a split written by pack_split.
+
+    The record index, labels and shard files are memory-mapped, so reading an image costs one
+    slice of an already-open file instead of an open/read/close per file.
+    """
+    def __init__(self, folder, name='train'):
+        paths = _shard_paths(folder, name)
+        self.records = np.load(paths['index'], mmap_mode='r')
+        self.labels = np.load(paths['labels'], mmap_mode='r')
+        with open(paths['names'], 'r') as file:
+            self.names = [line.rstrip("\n") for line in file]
+        self._shard_pattern = paths['shard']
+        self._shards = {}
+
+    def _shard(self, number):
+        shard = self._shards.get(number)
+        if shard is None:
+            with open(self._shard_pattern.format(number), 'rb') as file:
+                shard = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._shards[number] = shard
+        return shard
+
+    def __len__(self):
+        return len(self.records)
+
+    def image_bytes(self, i):
+        """
+        Encoded image bytes of record i.
+        """
+        record = self.records[i]
+        offset = int(record['offset'])
+        return self._shard(int(record['shard']))[offset:offset + int(record['length'])]
+
+    def boxes(self, i):
+        """
+        (n, 5) float32 view of record i's boxes (class, x, y, w, h) without parsing any text.
+        """
+        record = self.records[i]
+        start = int(record['label_start'])
+        return self.labels[start:start + int(record['label_count'])]
+
+    def image(self, i):
+        """
+        Decoded PIL image of record i.
+        """
+        return Image.open(io.BytesIO(self.image_bytes(i)))
+
+    def __getitem__(self, i):
+        return self.names[i], self.image_bytes(i), self.boxes(i)
+
+    def close(self):
+        for shard in self._shards.values():
+            shard.close()
+        self._shards = {}
+
+def benchmark_read(image_dir, label_dir, shard_folder, name='train', samples=1000, seed=0):
+    """
+    Compare random-access read throughput (image bytes + boxes) of the loose-file layout against
+    the packed shards. Run it on a cold cache (e.g. right after a reboot or on a network drive)
+    for realistic numbers. Returns {'loose': {...}, 'shards': {...}} with files/s and MB/s.
+    """
+    reader = ShardReader(shard_folder, name)
+    order = random.Random(seed).sample(range(len(reader)), min(samples, len(reader)))
+    stems = [os.path.splitext(reader.names[i])[0] for i in order]
+
+    start = time.perf_counter()
+    loose_bytes = 0
+    for i, stem in zip(order, stems):
+        with open(os.path.join(image_dir, reader.names[i]), 'rb') as file:
+            loose_bytes += len(file.read())
+        label_path = os.path.join(label_dir, stem + '.txt')
+        if os.path.exists(label_path):
+            parse_label_boxes(label_path)
+    loose_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    shard_bytes = 0
+    for i in order:
+        shard_bytes += len(reader.image_bytes(i))
+        np.asarray(reader.boxes(i))
+    shard_seconds = time.perf_counter() - start
+    reader.close()
+
+    report = {}
+    for layout, seconds, nbytes in (('loose', loose_seconds, loose_bytes), ('shards', shard_seconds, shard_bytes)):
+        report[layout] = {'files': len(order), 'seconds': seconds, 'files_per_s': len(order) / max(seconds, 1e-9),
+                          'mb_per_s': nbytes / max(seconds, 1e-9) / 1e6}
+        print(f"{layout:>6}: {format_throughput(len(order), nbytes, seconds)}")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack YOLO image/label folders into shards, or benchmark reading them.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    pack = subparsers.add_parser('pack', help="Pack a split into shards")
+    bench = subparsers.add_parser('bench', help="Compare loose-file and shard read throughput")
+    for sub in (pack, bench):
+        sub.add_argument('images', help="Image folder")
+        sub.add_argument('labels', help="Label folder")
+        sub.add_argument('output', help="Shard folder")
+        sub.add_argument('--name', default='train', help="Split name (file prefix)")
+    pack.add_argument('--shard-mb', type=int, default=1024, help="Target shard size in MB")
+    pack.add_argument('--workers', type=int, default=8, help="Reader threads")
+    bench.add_argument('--samples', type=int, default=1000, help="Number of random reads")
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        pack_split(args.images, args.labels, args.output, args.name, args.shard_mb << 20, args.workers)
+    else:
+        benchmark_read(args.images, args.labels, args.output, args.name, args.samples)
+
+if __name__ == '__main__':
+    sys.exit(main())
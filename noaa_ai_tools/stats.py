@@ -0,0 +1,272 @@
+# stats.py
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .dataset_index import DatasetIndex, user_cache_path
+
+STATS_CACHE_NAME = '.label_stats.npz'
+
+def parse_label_boxes(path):
+    """
+    Parse one YOLO label file into an (n, 5) float32 array of class, x, y, w, h.
+    Segmentation polygons are reduced to their bounding box; malformed rows are skipped.
+    """
+    boxes = []
+    with open(path, 'rb') as file:
+        for line in file:
+            row = line.split()
+            if len(row) == 5:
+                boxes.append(row)
+            elif len(row) >= 7 and len(row) % 2 == 1:
+                try:
+                    points = np.array(row[1:], dtype=np.float32).reshape(-1, 2)
+                except ValueError:
+                    continue
+                low, high = points.min(axis=0), points.max(axis=0)
+                center, size = (low + high) / 2, high - low
+                boxes.append([row[0], center[0], center[1], size[0], size[1]])
+    try:
+        return np.array(boxes, dtype=np.float32).reshape(-1, 5)
+    except ValueError:
+        return np.array([box for box in boxes if _is_numeric(box)], dtype=np.float32).reshape(-1, 5)
+
+def _is_numeric(row):
+    try:
+        [float(value) for value in row]
+        return True
+    except ValueError:
+        return False
+
+def read_image_size(path):
+    """
+    Return (width, height) from the image header without decoding pixels, or (0, 0) if unreadable.
+    """
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except (OSError, TypeError):
+        return 0, 0
+
+def _parse_stats_chunk(jobs):
+    results = []
+    for label_path, image_path in jobs:
+        boxes = parse_label_boxes(label_path) if label_path else np.zeros((0, 5), dtype=np.float32)
+        size = read_image_size(image_path) if image_path else (0, 0)
+        results.append((boxes, size))
+    return results
+
+class DatasetStats:
+    """
+    Columnar cache of every box in a label folder, with fast aggregate queries.
+
+    All boxes live in flat NumPy arrays (box_file, box_class, box_xywh) saved to a compressed
+    .npz (default: .label_stats.npz in the user cache directory, see user_cache_path). refresh() only reparses label files whose size or mtime changed,
+    so reruns on a large dataset take seconds and queries run as vectorized NumPy operations.
+    """
+    def __init__(self, label_folder, image_folder=None, cache_path=None):
+        self.label_folder = label_folder
+        self.image_folder = image_folder
+        self.cache_path = cache_path or user_cache_path(label_folder, STATS_CACHE_NAME)
+        self._empty()
+        self.load()
+
+    def _empty(self):
+        self.stems = np.zeros(0, dtype=str)
+        self.label_mtime = np.zeros(0, dtype=np.float64)
+        self.label_size = np.zeros(0, dtype=np.int64)
+        self.image_mtime = np.zeros(0, dtype=np.float64)
+        self.image_wh = np.zeros((0, 2), dtype=np.int32)
+        self.box_file = np.zeros(0, dtype=np.int32)
+        self.box_class = np.zeros(0, dtype=np.int32)
+        self.box_xywh = np.zeros((0, 4), dtype=np.float32)
+
+    def load(self):
+        """
+        Load the cache file if present. Returns True when a cache was found.
+        """
+        if not os.path.exists(self.cache_path):
+            return False
+        with np.load(self.cache_path) as data:
+            for name in ('stems', 'label_mtime', 'label_size', 'image_mtime', 'image_wh', 'box_file', 'box_class', 'box_xywh'):
+                setattr(self, name, data[name])
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.savez_compressed(file, stems=self.stems, label_mtime=self.label_mtime, label_size=self.label_size,
+                                image_mtime=self.image_mtime, image_wh=self.image_wh, box_file=self.box_file,
+                                box_class=self.box_class, box_xywh=self.box_xywh)
+        os.replace(tmp_path, self.cache_path)
+
+    def refresh(self, workers=None, chunk_size=1024, index=None):
+        """
+        Bring the cache up to date with the label (and image) folders, reparsing only changed files.
+        Returns the number of reparsed files.
+        """
+        start = time.perf_counter()
+        if index is None:
+            index = DatasetIndex(self.image_folder, self.label_folder)
+        entries = index.labels()
+
+        cached = {stem: i for i, stem in enumerate(self.stems.tolist())}
+        keep_old, keep_new, changed = [], [], []
+        for new_i, entry in enumerate(entries):
+            old_i = cached.get(entry.stem)
+            if (old_i is not None and self.label_mtime[old_i] == entry.label_mtime
+                    and self.label_size[old_i] == entry.label_size and self.image_mtime[old_i] == entry.image_mtime):
+                keep_old.append(old_i)
+                keep_new.append(new_i)
+            else:
+                changed.append(new_i)
+
+        # Carry unchanged boxes over by remapping their file numbers
+        old_to_new = np.full(len(self.stems), -1, dtype=np.int64)
+        old_to_new[keep_old] = keep_new
+        box_new_file = old_to_new[self.box_file] if len(self.box_file) else np.zeros(0, dtype=np.int64)
+        kept = box_new_file >= 0
+        box_file = [box_new_file[kept]]
+        box_class = [self.box_class[kept]]
+        box_xywh = [self.box_xywh[kept]]
+        image_wh = np.zeros((len(entries), 2), dtype=np.int32)
+        image_wh[keep_new] = self.image_wh[keep_old]
+
+        jobs = [(entries[i].label_path, entries[i].image_path) for i in changed]
+        chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(chunks) <= 1:
+            results = [_parse_stats_chunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+                results = list(executor.map(_parse_stats_chunk, chunks))
+        for new_i, (boxes, size) in zip(changed, (result for chunk in results for result in chunk)):
+            box_file.append(np.full(len(boxes), new_i, dtype=np.int64))
+            box_class.append(boxes[:, 0].astype(np.int32))
+            box_xywh.append(boxes[:, 1:])
+            image_wh[new_i] = size
+
+        box_file = np.concatenate(box_file)
+        order = np.argsort(box_file, kind='stable')
+        self.stems = np.array([entry.stem for entry in entries], dtype=str)
+        self.label_mtime = np.array([entry.label_mtime for entry in entries], dtype=np.float64)
+        self.label_size = np.array([entry.label_size for entry in entries], dtype=np.int64)
+        self.image_mtime = np.array([entry.image_mtime for entry in entries], dtype=np.float64)
+        self.image_wh = image_wh
+        self.box_file = box_file[order].astype(np.int32)
+        self.box_class = np.concatenate(box_class)[order]
+        self.box_xywh = np.concatenate(box_xywh)[order].astype(np.float32)
+        if changed or len(keep_old) != len(cached):
+            try:
+                self.save()
+            except OSError as e:
+                print(f"Could not write stats cache {self.cache_path}: {e}")
+        print(f"Dataset stats refreshed: {len(changed)} of {len(entries)} label files reparsed in {time.perf_counter() - start:.2f}s")
+        return len(changed)
+
+    # Aggregate queries
+
+    def class_counts(self):
+        """
+        Number of boxes per class ID. Negative IDs are left out (see invalid_class_boxes).
+        """
+        valid = self.box_class[self.box_class >= 0]
+        counts = np.bincount(valid) if len(valid) else np.zeros(0, dtype=np.int64)
+        return {int(c): int(n) for c, n in enumerate(counts) if n}
+
+    def images_per_class(self):
+        """
+        Number of label files containing each class ID.
+        """
+        valid = self.box_class >= 0
+        if not valid.any():
+            return {}
+        pairs = np.unique(np.stack([self.box_file[valid].astype(np.int64), self.box_class[valid].astype(np.int64)], axis=1), axis=0)
+        counts = np.bincount(pairs[:, 1])
+        return {int(c): int(n) for c, n in enumerate(counts) if n}
+
+    def invalid_class_boxes(self):
+        """
+        Number of boxes with a negative class ID (the dataset has not been validated).
+        """
+        return int(np.count_nonzero(self.box_class < 0))
+
+    def boxes_per_image(self):
+        """
+        Array with the number of boxes in each label file.
+        """
+        return np.bincount(self.box_file, minlength=len(self.stems))
+
+    def box_size_histogram(self, bins=20, pixels=False, class_id=None):
+        """
+        Histogram of box size (sqrt of area), normalized to [0, 1] or in pixels when image sizes are known.
+        Returns (counts, bin_edges).
+        """
+        mask = slice(None) if class_id is None else self.box_class == class_id
+        wh = self.box_xywh[mask, 2:4].astype(np.float64)
+        if pixels:
+            wh = wh * self.image_wh[self.box_file[mask]]
+        sizes = np.sqrt(wh[:, 0] * wh[:, 1])
+        return np.histogram(sizes, bins=bins, range=None if pixels else (0.0, 1.0))
+
+    def image_size_counts(self):
+        """
+        Number of images per (width, height); (0, 0) means unknown.
+        """
+        if not len(self.image_wh):
+            return {}
+        sizes, counts = np.unique(self.image_wh, axis=0, return_counts=True)
+        return {(int(w), int(h)): int(n) for (w, h), n in zip(sizes, counts)}
+
+    def summary(self):
+        """
+        Dict of headline numbers for the GUI and CLI.
+        """
+        per_image = self.boxes_per_image()
+        return {
+            'label_files': int(len(self.stems)),
+            'background_images': int(np.count_nonzero(per_image == 0)),
+            'boxes': int(len(self.box_class)),
+            'max_boxes_per_image': int(per_image.max()) if len(per_image) else 0,
+            'mean_boxes_per_image': float(per_image.mean()) if len(per_image) else 0.0,
+            'invalid_class_boxes': self.invalid_class_boxes(),
+            'class_counts': self.class_counts(),
+            'images_per_class': self.images_per_class(),
+            'image_sizes': {f"{w}x{h}": n for (w, h), n in self.image_size_counts().items()},
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a YOLO label folder using an incremental stats cache.")
+    parser.add_argument('labels', help="Folder of YOLO .txt label files")
+    parser.add_argument('--images', help="Folder of images (adds image size statistics)")
+    parser.add_argument('--workers', type=int, default=None, help="Parser processes (default: all CPUs)")
+    parser.add_argument('--json', action='store_true', help="Print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    stats = DatasetStats(args.labels, args.images)
+    stats.refresh(workers=args.workers)
+    summary = stats.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    for key in ('label_files', 'background_images', 'boxes', 'max_boxes_per_image', 'invalid_class_boxes'):
+        print(f"{key}: {summary[key]}")
+    print(f"mean_boxes_per_image: {summary['mean_boxes_per_image']:.2f}")
+    print("class  boxes  images")
+    for class_id, boxes in summary['class_counts'].items():
+        print(f"{class_id:>5}  {boxes:>5}  {summary['images_per_class'].get(class_id, 0):>6}")
+    counts, edges = stats.box_size_histogram(bins=10)
+    print("box size (sqrt area, fraction of image):")
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        print(f"  {low:.1f}-{high:.1f}: {count}")
+
+if __name__ == '__main__':
+    sys.exit(main())
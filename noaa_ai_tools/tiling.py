@@ -0,0 +1,171 @@
+# tiling.py
+
+import os
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .dataset_index import DatasetIndex
+from .dataprep import ensure_dir, assign_splits, read_label_classes
+from .stats import parse_label_boxes
+
+def tile_windows(width, height, tile_size, overlap=0.2):
+    """
+    Return (x0, y0, x1, y1) windows of tile_size pixels covering a width x height image.
+    Neighbouring tiles overlap by the given fraction, and the last row/column is aligned to the
+    image edge so no tile runs off the image.
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(tile_size * (1 - overlap)))
+        positions = list(range(0, length - tile_size, stride))
+        return positions + [length - tile_size]
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height)) for y in starts(height) for x in starts(width)]
+
+def clip_boxes_to_tile(boxes, window, width, height, min_visibility=0.3, min_pixels=4):
+    """
+    Clip normalized YOLO boxes (n, 5: class x y w h) of a width x height image to a pixel window
+    and renormalize them to the tile. Boxes keeping less than min_visibility of their area, or
+    narrower/shorter than min_pixels after clipping, are dropped as slivers.
+    """
+    if not len(boxes):
+        return boxes
+    x0, y0, x1, y1 = window
+    cls, xywh = boxes[:, 0], boxes[:, 1:].astype(np.float64)
+    scale = np.array([width, height], dtype=np.float64)
+    low = (xywh[:, :2] - xywh[:, 2:] / 2) * scale
+    high = (xywh[:, :2] + xywh[:, 2:] / 2) * scale
+    clipped_low = np.maximum(low, [x0, y0])
+    clipped_high = np.minimum(high, [x1, y1])
+    clipped_wh = clipped_high - clipped_low
+    area = np.prod(high - low, axis=1)
+    clipped_area = np.prod(np.clip(clipped_wh, 0, None), axis=1)
+    keep = (clipped_wh >= min_pixels).all(axis=1) & (clipped_area >= min_visibility * np.maximum(area, 1e-9))
+
+    tile_wh = np.array([x1 - x0, y1 - y0], dtype=np.float64)
+    center = ((clipped_low + clipped_high) / 2 - [x0, y0]) / tile_wh
+    size = clipped_wh / tile_wh
+    return np.column_stack([cls, center, size])[keep].astype(np.float32)
+
+def open_scaled(path, scale):
+    """
+    Open an image at the given scale with bounded memory. For JPEGs, scales of 1/2, 1/4 or 1/8
+    (and anything smaller) are decoded directly at reduced resolution by libjpeg instead of
+    decoding full size and shrinking.
+    """
+    image = Image.open(path)
+    width, height = image.size
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if scale < 1:
+        image.draft('RGB', target)
+    image = image.convert('RGB')
+    if image.size != target:
+        image = image.resize(target, Image.BILINEAR)
+    return image, (width, height)
+
+def _keep_empty_tile(name, fraction):
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64 < fraction
+
+def _tile_image(job):
+    """
+    Tile one source image at every scale and write tiles + labels into its split folder.
+    Returns (tiles written, boxes written), or the exception if the image cannot be read.
+    """
+    try:
+        return _tile_image_file(job)
+    except (OSError, Image.DecompressionBombError, SyntaxError) as e:
+        # One unreadable, truncated or oversized image fails alone, not the whole run
+        return e
+
+def _tile_image_file(job):
+    (image_path, label_path, split_dir, tile_size, overlap, scales,
+     min_visibility, min_pixels, empty_tile_fraction, quality) = job
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    boxes = parse_label_boxes(label_path) if label_path else np.zeros((0, 5), dtype=np.float32)
+    tiles = written_boxes = 0
+    for scale in scales:
+        image, _ = open_scaled(image_path, scale)
+        width, height = image.size
+        for window in tile_windows(width, height, tile_size, overlap):
+            tile_boxes = clip_boxes_to_tile(boxes, window, width, height, min_visibility, min_pixels)
+            name = f"{stem}_s{scale:g}_x{window[0]}_y{window[1]}"
+            if not len(tile_boxes) and not _keep_empty_tile(name, empty_tile_fraction):
+                continue
+            image.crop(window).save(os.path.join(split_dir, 'images', name + '.jpg'), quality=quality)
+            with open(os.path.join(split_dir, 'labels', name + '.txt'), 'w') as file:
+                for row in tile_boxes:
+                    file.write(f"{int(row[0])} {row[1]:.6f} {row[2]:.6f} {row[3]:.6f} {row[4]:.6f}\n")
+            tiles += 1
+            written_boxes += len(tile_boxes)
+        image.close()
+    return tiles, written_boxes
+
+def tile_dataset(images_dir, annotations_dir, output_dir, tile_size=640, overlap=0.2, scales=(1.0,),
+                 min_visibility=0.3, min_pixels=4, empty_tile_fraction=0.1, train_ratio=0.7, val_ratio=0.2,
+                 test_ratio=0.1, seed=0, splits=None, quality=95, workers=None, index=None):
+    """
+    Slice high-resolution images into overlapping tiles at several scales and write them straight
+    into output_dir/{train,val,test}/{images,labels}.
+
+    Each scale downsizes the source image before tiling (e.g. scales=(1.0, 0.5) gives full-resolution
+    tiles plus tiles covering four times the area). Boxes are clipped and renormalized per tile;
+    slivers below min_visibility of their original area or min_pixels wide are dropped. Tiles without
+    boxes are kept for an empty_tile_fraction of them as background. All tiles of a source image go to
+    the same split; splits ({stem: split}) can be passed in, otherwise they are assigned with
+    stratified assign_splits using the ratios and seed. Images are processed one per task on a pool
+    of `workers` processes, so memory stays bounded to a few decoded images. Images that cannot be
+    read are reported and counted as failed.
+
+    Returns a dict mapping each split name to its source images, tiles, boxes and failed images.
+    """
+    if index is None:
+        index = DatasetIndex(images_dir, annotations_dir)
+    entries = index.images()
+
+    if splits is None:
+        image_classes = {entry.stem: read_label_classes(entry.label_path) if entry.has_label else frozenset()
+                         for entry in entries}
+        splits = assign_splits(image_classes, {'train': train_ratio, 'val': val_ratio, 'test': test_ratio}, seed)
+
+    split_names = sorted(set(splits.values()))
+    for name in split_names:
+        ensure_dir(os.path.join(output_dir, name, 'images'))
+        ensure_dir(os.path.join(output_dir, name, 'labels'))
+
+    jobs = [(entry.image_path, entry.label_path, os.path.join(output_dir, splits[entry.stem]), tile_size, overlap,
+             tuple(scales), min_visibility, min_pixels, empty_tile_fraction, quality)
+            for entry in entries if entry.stem in splits]
+
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = list(map(_tile_image, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_tile_image, jobs, chunksize=4))
+    seconds = time.perf_counter() - start
+
+    report = {name: {'images': 0, 'tiles': 0, 'boxes': 0, 'failed': 0} for name in split_names}
+    for job, result in zip(jobs, results):
+        split = report[os.path.basename(job[2])]
+        if isinstance(result, Exception):
+            split['failed'] += 1
+            print(f"Failed to tile {job[0]}: {result}")
+            continue
+        tiles, boxes = result
+        split['images'] += 1
+        split['tiles'] += tiles
+        split['boxes'] += boxes
+    for name, split in report.items():
+        print(f"{name}: {split['tiles']} tiles with {split['boxes']} boxes from {split['images']} images "
+              f"({split['failed']} failed)")
+    total_tiles = sum(split['tiles'] for split in report.values())
+    print(f"Tiled {len(jobs)} images in {seconds:.1f}s ({len(jobs) / max(seconds, 1e-9):.1f} images/s, "
+          f"{total_tiles / max(seconds, 1e-9):.1f} tiles/s)")
+    return report
@@ -15,7 +15,10 @@ setup(
         'ultralytics',
         'pyqtdarktheme',
         'PyQtWebEngine',
-        'plotly'
+        'plotly',
+        'numpy',
+        'pyyaml',
+        'pillow'
     ],
     classifiers=[
         "Programming Language :: Python :: 3.10",
@@ -28,6 +31,9 @@ setup(
     entry_points={
         'console_scripts': [
             'noaa-ai-gui=noaa_ai_gui.main:main',  # Launch the GUI
+            'noaa-ai-stats=noaa_ai_tools.stats:main',  # Print dataset statistics
+            'noaa-ai-resize-cache=noaa_ai_tools.resize_cache:main',  # Pre-resize a dataset for training
+            'noaa-shards=noaa_ai_tools.shards:main',  # Pack a split into shards or benchmark reading them
         ],
     },
     keywords="AI, NOAA, datasets, GUI, toolkit, machine learning",